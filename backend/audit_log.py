@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+
+from db import get_db
+
+# rows waiting to be written; producers block (then write inline) once it is full
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000"))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "500"))
+# seconds a partial batch may wait before it is flushed
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "0.5"))
+# seconds a producer waits for queue space before writing its row itself
+AUDIT_LOG_PUT_TIMEOUT = float(os.getenv("AUDIT_LOG_PUT_TIMEOUT", "1"))
+AUDIT_LOG_RETRIES = 3
+# rows still unwritten at shutdown are saved here and re-queued on the next start
+AUDIT_LOG_SPILL_FILE = os.getenv("AUDIT_LOG_SPILL_FILE", "audit_log_spill.jsonl")
+
+INSERT_ACTIVITY = """
+    INSERT INTO user_activity_log (user_id, action, metadata, file_id, recipient_id, created_at)
+    VALUES %s
+"""
+
+_queue = queue.Queue(maxsize=AUDIT_LOG_QUEUE_SIZE)
+_stop = object()
+_stopping = threading.Event()
+_writer = None
+
+
+def _write_rows(rows, conn=None):
+    if conn is None:
+        with get_db() as own_conn:
+            _write_rows(rows, own_conn)
+        return
+    with conn.cursor() as cursor:
+        execute_values(cursor, INSERT_ACTIVITY, rows, page_size=AUDIT_LOG_BATCH_SIZE)
+    conn.commit()
+
+
+def _flush(rows) -> bool:
+    for attempt in range(AUDIT_LOG_RETRIES):
+        try:
+            _write_rows(rows)
+            return True
+        except Exception as e:
+            print(f"Audit log flush failed ({attempt + 1}/{AUDIT_LOG_RETRIES}): {e}")
+            time.sleep(0.5 * (attempt + 1))
+    return False
+
+
+def _spill(rows):
+    with open(AUDIT_LOG_SPILL_FILE, "a") as f:
+        for row in rows:
+            f.write(json.dumps([*row[:5], row[5].isoformat()]) + "\n")
+    print(f"Audit log saved {len(rows)} unwritten rows to {AUDIT_LOG_SPILL_FILE}")
+
+
+def _load_spilled() -> list:
+    try:
+        with open(AUDIT_LOG_SPILL_FILE) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    os.unlink(AUDIT_LOG_SPILL_FILE)
+    return [(*row[:5], datetime.fromisoformat(row[5])) for row in rows]
+
+
+def _run(pending):
+    # rows that failed to write stay at the head of pending and go out with
+    # the next flush; they are never dropped
+    stopping = False
+    while not stopping:
+        # while the database is down, stop taking new rows once pending holds a
+        # queue's worth, so producers get backpressure (and write inline) instead
+        batch = []
+        if len(pending) < AUDIT_LOG_QUEUE_SIZE:
+            try:
+                item = _queue.get(timeout=None if not pending else AUDIT_LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                item = None
+            if item is _stop:
+                break
+            if item is not None:
+                batch.append(item)
+                deadline = time.monotonic() + AUDIT_LOG_FLUSH_INTERVAL
+                while len(batch) < AUDIT_LOG_BATCH_SIZE:
+                    try:
+                        item = _queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _stop:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+        rows = pending + batch
+        if _flush(rows):
+            pending = []
+        else:
+            pending = rows
+            if _stopping.is_set():
+                # shutting down with the database unreachable: spill below
+                break
+
+    # drain whatever was queued behind the stop marker
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _stop:
+            pending.append(item)
+    if pending and not _flush(pending):
+        _spill(pending)
+
+
+def start_audit_writer():
+    global _writer
+    if _writer is not None:
+        return
+    _writer = threading.Thread(target=_run, args=(_load_spilled(),), name="audit-log", daemon=True)
+    _stopping.clear()
+    _writer.start()
+
+
+def stop_audit_writer():
+    global _writer
+    if _writer is None:
+        return
+    _stopping.set()
+    _queue.put(_stop)
+    _writer.join()
+    _writer = None
+
+
+def log_activity(user_id, action: str, metadata: str, file_id=None, recipient_id=None, conn=None):
+    # the timestamp is taken now, not at flush time, so time-window checks stay exact
+    row = (user_id, action, metadata, file_id, recipient_id, datetime.now(timezone.utc))
+    # callers still holding a connection pass it, so the inline fallback never
+    # waits on the pool for a second one; it commits, so call after your own commit
+    if _writer is None:
+        _write_rows([row], conn)
+        return
+    try:
+        _queue.put(row, timeout=AUDIT_LOG_PUT_TIMEOUT)
+    except queue.Full:
+        _write_rows([row], conn)
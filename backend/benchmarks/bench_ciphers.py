@@ -0,0 +1,80 @@
+# Chunked encrypt/decrypt throughput per container cipher at 1 MB, 100 MB and
+# 1 GB. Each segment is decrypted as soon as it is encrypted, so memory stays
+# at one chunk regardless of size. The legacy single-shot EAX blob is only
+# timed up to BENCH_LEGACY_MAX (100 MB by default) since it is held in memory.
+#
+#   BENCH_SIZES=1M,100M,1G python benchmarks/bench_ciphers.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from Cryptodome.Cipher import AES
+from utils.file_crypto import ChunkEncryptor, ChunkDecryptor, CIPHERS, CHUNK_SIZE
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    return int(text[:-1]) * UNITS[text[-1].upper()] if text[-1].upper() in UNITS else int(text)
+
+
+SIZES = [parse_size(s) for s in os.getenv("BENCH_SIZES", "1M,100M,1G").split(",")]
+LEGACY_MAX = parse_size(os.getenv("BENCH_LEGACY_MAX", "100M"))
+
+
+def chunked(cipher_id, size, key, block):
+    # each segment is decrypted right after it is produced, so only one
+    # chunk is alive at a time even for the 1 GB run
+    encryptor = ChunkEncryptor(key, CHUNK_SIZE, cipher_id)
+    decryptor = ChunkDecryptor(key, encryptor.header())
+    encrypt_time = decrypt_time = 0.0
+    remaining = size
+    index = 0
+    while remaining > 0:
+        chunk = block if remaining >= CHUNK_SIZE else block[:remaining]
+        remaining -= len(chunk)
+        last = remaining == 0
+
+        start = time.perf_counter()
+        segment = encryptor.encrypt_chunk(chunk, last=last)
+        middle = time.perf_counter()
+        decryptor.decrypt_chunk(index, segment, last)
+        decrypt_time += time.perf_counter() - middle
+        encrypt_time += middle - start
+        index += 1
+    return encrypt_time, decrypt_time
+
+
+def legacy(size, key):
+    data = os.urandom(size)
+    start = time.perf_counter()
+    cipher = AES.new(key, AES.MODE_EAX)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    encrypt_time = time.perf_counter() - start
+    start = time.perf_counter()
+    AES.new(key, AES.MODE_EAX, nonce=cipher.nonce).decrypt_and_verify(ciphertext, tag)
+    return encrypt_time, time.perf_counter() - start
+
+
+def mbps(size, seconds):
+    return size / (1 << 20) / seconds
+
+
+def main():
+    key = os.urandom(32)
+    block = os.urandom(CHUNK_SIZE)
+    print(f"{'cipher':<20}{'size':>8}{'encrypt MB/s':>15}{'decrypt MB/s':>15}")
+    for size in SIZES:
+        label = f"{size / (1 << 20):g}M"
+        for name, cipher_id in CIPHERS.items():
+            encrypt_time, decrypt_time = chunked(cipher_id, size, key, block)
+            print(f"{name:<20}{label:>8}{mbps(size, encrypt_time):>15.1f}{mbps(size, decrypt_time):>15.1f}")
+        if size <= LEGACY_MAX:
+            encrypt_time, decrypt_time = legacy(size, key)
+            print(f"{'legacy eax blob':<20}{label:>8}{mbps(size, encrypt_time):>15.1f}{mbps(size, decrypt_time):>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Measures /files/my-files latency with and without concurrent /admin/allactivity load.
+# If admin queries block the event loop, p99 in the second phase climbs with the
+# admin query time; with DB work offloaded it should stay close to the baseline.
+#
+#   BENCH_URL=http://localhost:8000 BENCH_USER_TOKEN=... BENCH_ADMIN_TOKEN=... \
+#       python benchmarks/bench_event_loop.py
+import os
+import time
+import asyncio
+import statistics
+import httpx
+
+BASE_URL = os.getenv("BENCH_URL", "http://localhost:8000")
+USER_TOKEN = os.getenv("BENCH_USER_TOKEN")
+ADMIN_TOKEN = os.getenv("BENCH_ADMIN_TOKEN")
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "10"))
+ADMIN_WORKERS = int(os.getenv("BENCH_ADMIN_WORKERS", "4"))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure_my_files(client):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    headers = {"Authorization": f"Bearer {USER_TOKEN}"}
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/files/my-files", headers=headers)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one() for _ in range(REQUESTS)))
+
+
+async def admin_load(client, stop):
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    while not stop.is_set():
+        await client.get("/admin/allactivity", headers=headers)
+
+
+def report(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(
+        f"{label:<28} n={len(ms):<5} p50={statistics.median(ms):8.1f}ms "
+        f"p99={percentile(ms, 99):8.1f}ms max={max(ms):8.1f}ms"
+    )
+
+
+async def main():
+    if not USER_TOKEN or not ADMIN_TOKEN:
+        raise SystemExit("BENCH_USER_TOKEN and BENCH_ADMIN_TOKEN must be set")
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=120.0) as client:
+        report("my-files (idle)", await measure_my_files(client))
+
+        stop = asyncio.Event()
+        admin_tasks = [asyncio.create_task(admin_load(client, stop)) for _ in range(ADMIN_WORKERS)]
+        try:
+            report("my-files (+allactivity)", await measure_my_files(client))
+        finally:
+            stop.set()
+            await asyncio.gather(*admin_tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
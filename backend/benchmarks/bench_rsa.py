@@ -0,0 +1,55 @@
+# Compares the original pure-Python square-and-multiply path with native pow()
+# and the CRT private-key path, using a 2048-bit key from utils.rsa.
+#
+#   python benchmarks/bench_rsa.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.rsa import generate_rsa_keys, parse_private_key, rsa_private_op
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "20"))
+
+
+def legacy_modulo_exp(a, m, n):
+    binary = bin(m)[2:]
+    d = 1
+    for bit in binary:
+        d = (d * d) % n
+        if bit == '1':
+            d = (d * a) % n
+    return d
+
+
+def timed(label, func, baseline=None):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    per_op = (time.perf_counter() - start) / ROUNDS
+    speedup = f"  x{baseline / per_op:5.1f}" if baseline else ""
+    print(f"{label:<28} {per_op * 1000:9.2f} ms/op{speedup}")
+    return per_op
+
+
+def main():
+    public_key, private_key = generate_rsa_keys(bits=2048)
+    e, n = map(int, public_key.split(","))
+    key = parse_private_key(private_key)
+    plain_key = key._replace(p=None, q=None, dp=None, dq=None, qinv=None)
+    message = int.from_bytes(os.urandom(64).hex().encode(), "big")
+    ciphertext = pow(message, e, n)
+
+    print(f"2048-bit RSA, {ROUNDS} rounds")
+    legacy = timed("decrypt: moduloExp (legacy)", lambda: legacy_modulo_exp(ciphertext, key.d, n))
+    timed("decrypt: pow(d, n)", lambda: rsa_private_op(plain_key, ciphertext), legacy)
+    timed("decrypt: CRT", lambda: rsa_private_op(key, ciphertext), legacy)
+    legacy = timed("encrypt: moduloExp (legacy)", lambda: legacy_modulo_exp(message, e, n))
+    timed("encrypt: pow(e, n)", lambda: pow(message, e, n), legacy)
+
+    assert rsa_private_op(key, ciphertext) == message == legacy_modulo_exp(ciphertext, key.d, n)
+
+
+if __name__ == "__main__":
+    main()
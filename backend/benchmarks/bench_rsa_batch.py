@@ -0,0 +1,61 @@
+# Unwraps the AES keys of a BENCH_FILES-file account (1,000 by default) with a
+# 2048-bit key, once with one process-pool task per file (the old /my-files
+# path) and once through run_cpu_batched + unwrap_aes_keys.
+#
+#   CPU_WORKERS=4 python benchmarks/bench_rsa_batch.py
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from Cryptodome.Random import get_random_bytes
+from executors import process_pool, run_cpu_batched, shutdown_executors, CPU_WORKERS
+from utils.rsa import generate_rsa_keys, encrypt_rsa, decrypt_rsa, unwrap_aes_keys
+
+FILES = int(os.getenv("BENCH_FILES", "1000"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+
+
+async def per_file(private_key, wrapped):
+    loop = asyncio.get_running_loop()
+    hex_keys = await asyncio.gather(*(
+        loop.run_in_executor(process_pool, decrypt_rsa, private_key, int(w)) for w in wrapped
+    ))
+    return [bytes.fromhex(h.strip()) for h in hex_keys]
+
+
+async def batched(private_key, wrapped):
+    return await run_cpu_batched(unwrap_aes_keys, private_key, wrapped)
+
+
+async def timed(label, func, private_key, wrapped, expected):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = await func(private_key, wrapped)
+        elapsed = time.perf_counter() - start
+        assert result == expected
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:>10}: {best * 1000:8.1f} ms  ({FILES / best:8.0f} keys/s)")
+    return best
+
+
+async def main():
+    public_key, private_key = generate_rsa_keys(2048)
+    aes_keys = [get_random_bytes(32) for _ in range(FILES)]
+    wrapped = [str(encrypt_rsa(public_key, k.hex())) for k in aes_keys]
+
+    # warm the worker processes so start-up is not counted
+    await batched(private_key, wrapped[:CPU_WORKERS])
+
+    print(f"{FILES} wrapped keys, {CPU_WORKERS} workers, best of {ROUNDS}")
+    old = await timed("per file", per_file, private_key, wrapped, aes_keys)
+    new = await timed("batched", batched, private_key, wrapped, aes_keys)
+    print(f"speed-up: {old / new:.2f}x")
+    shutdown_executors()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
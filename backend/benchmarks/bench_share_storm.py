@@ -0,0 +1,78 @@
+# Measures /auth/user-details latency while BENCH_SHARERS clients hammer
+# /share/share-file. With the RSA re-wrap offloaded to the process pool the
+# probe's p99 should stay near the idle baseline; when the crypto ran inline
+# on the event loop every share stalled all other requests on the worker.
+# Keep BENCH_RECIPIENTS to fewer than 50 addresses or the sharing account is
+# locked by the share rate limit.
+#
+#   BENCH_URL=http://localhost:8000 BENCH_USER_TOKEN=... BENCH_FILE_NAME=report.txt \
+#       BENCH_RECIPIENTS=a@example.com,b@example.com python benchmarks/bench_share_storm.py
+import os
+import time
+import asyncio
+import statistics
+import httpx
+
+BASE_URL = os.getenv("BENCH_URL", "http://localhost:8000")
+USER_TOKEN = os.getenv("BENCH_USER_TOKEN")
+FILE_NAME = os.getenv("BENCH_FILE_NAME")
+RECIPIENTS = [r for r in os.getenv("BENCH_RECIPIENTS", "").split(",") if r]
+PROBES = int(os.getenv("BENCH_PROBES", "200"))
+SHARERS = int(os.getenv("BENCH_SHARERS", "16"))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def probe(client):
+    headers = {"Authorization": f"Bearer {USER_TOKEN}"}
+    samples = []
+    for _ in range(PROBES):
+        start = time.perf_counter()
+        response = await client.get("/auth/user-details", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def share_storm(client, stop, counts):
+    headers = {"Authorization": f"Bearer {USER_TOKEN}"}
+    index = 0
+    while not stop.is_set():
+        payload = {"file_name": FILE_NAME, "shared_with_email": RECIPIENTS[index % len(RECIPIENTS)]}
+        response = await client.post("/share/share-file", json=payload, headers=headers)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        index += 1
+
+
+def report(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(
+        f"{label:<24} n={len(ms):<5} p50={statistics.median(ms):8.1f}ms "
+        f"p99={percentile(ms, 99):8.1f}ms max={max(ms):8.1f}ms"
+    )
+
+
+async def main():
+    if not USER_TOKEN or not FILE_NAME or not RECIPIENTS:
+        raise SystemExit("BENCH_USER_TOKEN, BENCH_FILE_NAME and BENCH_RECIPIENTS must be set")
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=120.0) as client:
+        report("user-details (idle)", await probe(client))
+
+        stop = asyncio.Event()
+        counts = {}
+        sharers = [asyncio.create_task(share_storm(client, stop, counts)) for _ in range(SHARERS)]
+        try:
+            report("user-details (+shares)", await probe(client))
+        finally:
+            stop.set()
+            await asyncio.gather(*sharers, return_exceptions=True)
+        print(f"share responses by status: {counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+# Times /admin/suspicious-activity's detection query against a synthetic
+# user_activity_log of BENCH_ROWS rows (run once with 1000000 and once with
+# 10000000). Data lives in a scratch schema that is dropped afterwards, so
+# real tables are never touched. The legacy triple self-join plus per-user
+# loop is timed too unless BENCH_LEGACY=0; it is cut off by statement_timeout
+# on large tables. With BENCH_RESULTS set, each timing is also appended to
+# that file as a markdown table row, so the 1M and 10M runs can be recorded.
+#
+#   DATABASE_URL=... BENCH_ROWS=1000000 BENCH_RESULTS=suspicious.md python benchmarks/bench_suspicious.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "unused")
+# routers import the key store; the benchmark never reads user keys
+os.environ.setdefault("KEY_STORE_MASTER_KEY", "00" * 32)
+
+import psycopg2
+from db import DATABASE_URL
+from routers.admin import SUSPICIOUS_ACTIVITY_SQL
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+USERS = int(os.getenv("BENCH_USERS", "10000"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+RUN_LEGACY = os.getenv("BENCH_LEGACY", "1") != "0"
+LEGACY_TIMEOUT_MS = int(os.getenv("BENCH_LEGACY_TIMEOUT_MS", "300000"))
+RESULTS_FILE = os.getenv("BENCH_RESULTS")
+SCHEMA = "bench_suspicious"
+
+
+def seed(cursor):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.users (LIKE public.users INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING INDEXES)")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.user_activity_log (LIKE public.user_activity_log INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING INDEXES)")
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.users (id, email, password, rsa_public_key, role, is_locked)
+        OVERRIDING SYSTEM VALUE
+        SELECT g, 'bench' || g || '@example.com', '', '', 'user', g %% 100 = 0
+        FROM generate_series(1, %s) g
+    """, (USERS,))
+    # mostly logins and downloads, with a few per cent of uploads, shares and failures
+    # spread over 30 days so bursts are rare and realistic
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.user_activity_log (user_id, action, metadata, created_at)
+        SELECT 1 + (random() * (%s - 1))::int,
+               (ARRAY['login', 'login', 'download', 'upload', 'share', 'failed_login'])[1 + (random() * 5)::int],
+               'recipient' || (random() * 200)::int || '@example.com',
+               NOW() - random() * INTERVAL '30 days'
+        FROM generate_series(1, %s)
+    """, (USERS, ROWS))
+    cursor.execute(f"ANALYZE {SCHEMA}.users")
+    cursor.execute(f"ANALYZE {SCHEMA}.user_activity_log")
+
+
+def legacy_detect(cursor):
+    cursor.execute("SELECT id FROM users WHERE is_locked = TRUE")
+    cursor.fetchall()
+    for action, having in (("upload", "COUNT(*) > 100"), ("share", "COUNT(DISTINCT a.metadata) > 50")):
+        cursor.execute(f"""
+            SELECT u.id, u.email, COUNT(*), MIN(a.created_at), MAX(a.created_at)
+            FROM user_activity_log a JOIN users u ON u.id = a.user_id
+            WHERE a.action = %s GROUP BY u.id, u.email HAVING {having}
+        """, (action,))
+        cursor.fetchall()
+    cursor.execute("""
+        SELECT DISTINCT u.id, u.email
+        FROM user_activity_log a1
+        JOIN user_activity_log a2 ON a1.user_id = a2.user_id
+        JOIN user_activity_log a3 ON a1.user_id = a3.user_id
+        JOIN users u ON u.id = a1.user_id
+        WHERE a1.action = 'failed_login' AND a2.action = 'failed_login' AND a3.action = 'failed_login'
+          AND a1.created_at < a2.created_at AND a2.created_at < a3.created_at
+          AND a3.created_at <= a1.created_at + INTERVAL '1 minute'
+    """)
+    for user_id, _ in cursor.fetchall():
+        cursor.execute("""
+            SELECT COUNT(*), MIN(created_at), MAX(created_at)
+            FROM user_activity_log WHERE user_id = %s AND action = 'failed_login'
+        """, (user_id,))
+        cursor.fetchone()
+
+
+def window_detect(cursor):
+    cursor.execute("SELECT email FROM users WHERE is_locked = TRUE")
+    cursor.fetchall()
+    cursor.execute(SUSPICIOUS_ACTIVITY_SQL.format(date_filter=""), (10, 0))
+    cursor.fetchall()
+
+
+def timed(label, func, cursor, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        try:
+            func(cursor)
+        except psycopg2.errors.QueryCanceled:
+            cursor.connection.rollback()
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+            print(f"{label:>14}: exceeded {LEGACY_TIMEOUT_MS} ms")
+            record(label, f"> {LEGACY_TIMEOUT_MS}", "-")
+            return
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    median, worst = samples[len(samples) // 2] * 1000, samples[-1] * 1000
+    print(f"{label:>14}: median {median:10.1f} ms   max {worst:10.1f} ms")
+    record(label, f"{median:.1f}", f"{worst:.1f}")
+
+
+def record(label, median, worst):
+    if not RESULTS_FILE:
+        return
+    new_file = not os.path.exists(RESULTS_FILE)
+    with open(RESULTS_FILE, "a") as f:
+        if new_file:
+            f.write("| rows | users | query | median ms | max ms |\n|---|---|---|---|---|\n")
+        f.write(f"| {ROWS} | {USERS} | {label} | {median} | {worst} |\n")
+
+
+def main():
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            print(f"seeding {ROWS} activity rows for {USERS} users ...")
+            seed(cursor)
+            conn.commit()
+
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+            timed("window query", window_detect, cursor, ROUNDS)
+            if RUN_LEGACY:
+                cursor.execute("SET statement_timeout = %s", (LEGACY_TIMEOUT_MS,))
+                timed("legacy joins", legacy_detect, cursor, 1)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
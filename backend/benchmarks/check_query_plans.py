@@ -0,0 +1,192 @@
+# Fails (exit 1) if any hot router query is planned with a sequential scan
+# over a large table. Seeds a scratch schema with BENCH_ROWS activity rows
+# (1M by default) plus proportional users/files/shares, creates the indexes
+# from the index migration there and runs EXPLAIN on each query, all in one
+# transaction that is rolled back at the end. The trigram email index is only
+# built when pg_trgm is installed (apply_migrations tries to install it).
+#
+#   DATABASE_URL=... python benchmarks/check_query_plans.py
+import os
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "unused")
+# routers import the key store; the benchmark never reads user keys
+os.environ.setdefault("KEY_STORE_MASTER_KEY", "00" * 32)
+
+import psycopg2
+from db import DATABASE_URL
+from migrations import MIGRATIONS, TRGM_EMAIL_INDEX
+from routers.admin import ACTIVITY_SELECT, SUSPICIOUS_ACTIVITY_SQL
+from user_search import SEARCH_SQL
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+USERS = max(ROWS // 10, 1000)
+FILES = max(ROWS // 4, 1000)
+# seq scans over tables smaller than this are left to the planner
+MIN_SCAN_ROWS = int(os.getenv("CHECK_MIN_SCAN_ROWS", "10000"))
+INDEX_MIGRATION = 6
+SCHEMA = "bench_plans"
+
+NOW = datetime.now(timezone.utc)
+DAY = (NOW - timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+# (endpoint, query, params) mirroring the statements the routers run
+QUERIES = [
+    ("auth/login", "SELECT id, email, password, role, is_locked FROM users WHERE email = %s",
+     ("bench42@example.com",)),
+    ("files/my-files uploaded_at", """
+        SELECT f.id, f.file_name FROM files f WHERE f.owner_id = %s
+        ORDER BY f.created_at DESC, f.id DESC LIMIT 21
+     """, (42,)),
+    ("files/my-files file_name", """
+        SELECT f.id, f.file_name FROM files f WHERE f.owner_id = %s AND (f.file_name, f.id) > (%s, %s)
+        ORDER BY f.file_name ASC, f.id ASC LIMIT 21
+     """, (42, "file100", 100)),
+    ("files/my-files file_size", """
+        SELECT f.id, f.file_name FROM files f WHERE f.owner_id = %s
+        ORDER BY COALESCE(f.file_size, 0) DESC, f.id DESC LIMIT 21
+     """, (42,)),
+    ("files/download", "SELECT file_url FROM files WHERE file_name = %s AND owner_id = %s",
+     ("file42", 42)),
+    ("share/shared-files", """
+        SELECT f.file_name, o.email FROM shared_files sf
+        JOIN files f ON sf.file_id = f.id
+        JOIN users o ON f.owner_id = o.id
+        WHERE sf.shared_with = %s
+     """, (42,)),
+    ("share/download", """
+        SELECT f.file_type FROM shared_files sf
+        JOIN files f ON sf.file_id = f.id
+        JOIN users o ON f.owner_id = o.id
+        WHERE sf.shared_with = %s AND f.file_name = %s AND o.email = %s LIMIT 1
+     """, (42, "file42", "bench42@example.com")),
+    ("admin/users", """
+        SELECT id, email FROM users WHERE role = 'user' AND (email, id) > (%s, %s)
+        ORDER BY email, id LIMIT 51
+     """, ("bench5", 5)),
+    ("admin/activity-log", f"""
+        {ACTIVITY_SELECT}
+        WHERE (a.created_at, a.id) < (%s, %s)
+        ORDER BY a.created_at DESC, a.id DESC LIMIT 51
+     """, (NOW, 2 ** 62)),
+    ("admin/user-activity", """
+        SELECT a.action FROM user_activity_log a JOIN users u ON a.user_id = u.id
+        WHERE u.email = %s ORDER BY a.created_at DESC, a.id DESC LIMIT 11
+     """, ("bench42@example.com",)),
+    ("admin/search-users", SEARCH_SQL, {
+        "query": "ench4242", "prefix": "ench4242%", "pattern": "%ench4242%", "after": None,
+        "after_tier": None, "after_score": None, "after_email": None, "after_id": None, "limit": 11,
+     }),
+    ("admin/filter-activity", """
+        SELECT u.email, a.action FROM user_activity_log a JOIN users u ON a.user_id = u.id
+        WHERE a.action = %s AND a.created_at >= %s AND a.created_at < %s
+        ORDER BY a.created_at DESC
+     """, ("share", DAY, DAY + timedelta(days=1))),
+    ("admin/suspicious-activity", SUSPICIOUS_ACTIVITY_SQL.format(
+        date_filter=" AND a.created_at >= %s AND a.created_at < %s"
+     ), (DAY, DAY + timedelta(days=1), 10, 0)),
+    ("admin/locked-users", "SELECT email FROM users WHERE is_locked = TRUE", ()),
+]
+
+
+def seed(cursor):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in ("users", "files", "shared_files", "user_activity_log"):
+        cursor.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS)")
+    cursor.execute(f"SET search_path TO {SCHEMA}, public, extensions")
+
+    cursor.execute("""
+        INSERT INTO users (id, email, password, rsa_public_key, role, is_locked)
+        OVERRIDING SYSTEM VALUE
+        SELECT g, 'bench' || g || '@example.com', '', '', 'user', g %% 1000 = 0
+        FROM generate_series(1, %s) g
+    """, (USERS,))
+    cursor.execute("""
+        INSERT INTO files (id, owner_id, file_name, file_type, file_url, encrypted_aes_key, file_size, created_at)
+        OVERRIDING SYSTEM VALUE
+        SELECT g, 1 + g %% %s, 'file' || g, 'text/plain', '', '', g, NOW() - random() * INTERVAL '30 days'
+        FROM generate_series(1, %s) g
+    """, (USERS, FILES))
+    cursor.execute("""
+        INSERT INTO shared_files (file_id, shared_with, encrypted_aes_key)
+        SELECT 1 + (random() * (%s - 1))::int, 1 + (random() * (%s - 1))::int, ''
+        FROM generate_series(1, %s)
+    """, (FILES, USERS, FILES))
+    cursor.execute("""
+        INSERT INTO user_activity_log (id, user_id, action, metadata, file_id, recipient_id, created_at)
+        OVERRIDING SYSTEM VALUE
+        SELECT g, 1 + (random() * (%s - 1))::int,
+               (ARRAY['login', 'download', 'upload', 'share', 'failed_login'])[1 + (random() * 4)::int],
+               'bench' || (random() * %s)::int || '@example.com', NULL, NULL,
+               NOW() - random() * INTERVAL '30 days'
+        FROM generate_series(1, %s) g
+    """, (USERS, USERS, ROWS))
+
+    statements = next(m[2] for m in MIGRATIONS if m[0] == INDEX_MIGRATION)
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    has_trgm = cursor.fetchone() is not None
+    if has_trgm:
+        statements = statements + [TRGM_EMAIL_INDEX]
+    for statement in statements:
+        # the extension step is database-wide and left to the real migration;
+        # CONCURRENTLY cannot run inside the check's transaction
+        if not callable(statement):
+            cursor.execute(statement.replace(" CONCURRENTLY", ""))
+    for table in ("users", "files", "shared_files", "user_activity_log"):
+        cursor.execute(f"ANALYZE {table}")
+    return has_trgm
+
+
+def seq_scans(plan, found):
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        seq_scans(child, found)
+    return found
+
+
+def main():
+    conn = psycopg2.connect(DATABASE_URL)
+    failures = []
+    try:
+        with conn.cursor() as cursor:
+            print(f"seeding {ROWS} activity rows, {FILES} files, {USERS} users ...")
+            has_trgm = seed(cursor)
+
+            cursor.execute("""
+                SELECT relname, reltuples::BIGINT FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind = 'r'
+            """, (SCHEMA,))
+            sizes = dict(cursor.fetchall())
+
+            for name, query, params in QUERIES:
+                if query is SEARCH_SQL and not has_trgm:
+                    # search runs in-process without pg_trgm
+                    print(f"skip  {name}  (pg_trgm not installed)")
+                    continue
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                large = [t for t in seq_scans(plan[0]["Plan"], []) if sizes.get(t, 0) >= MIN_SCAN_ROWS]
+                status = "FAIL" if large else "ok"
+                print(f"{status:>4}  {name}" + (f"  (seq scan on {', '.join(sorted(set(large)))})" if large else ""))
+                if large:
+                    failures.append(name)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        print(f"{len(failures)} queries fall back to sequential scans")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
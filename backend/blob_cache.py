@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+
+from http_client import fetch
+
+# Local copies of ciphertext blobs, so listings stop re-downloading them from
+# storage. Entries are keyed by storage URL plus file id: a path reused after
+# a delete gets a new id and can never hit the old blob. Only ciphertext is
+# stored; it is still verified by decrypt_blob on every read.
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cipherdrive-blobs"))
+# total bytes kept on disk; 0 disables the cache
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1 << 30)))
+# blobs larger than this are never cached
+BLOB_CACHE_MAX_ENTRY = int(os.getenv("BLOB_CACHE_MAX_ENTRY", str(64 << 20)))
+
+
+class BlobCache:
+    def __init__(self, directory: str, max_bytes: int, max_entry: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry = max_entry
+        self.lock = threading.Lock()
+        # bytes written by this process since the directory was last measured;
+        # starts full so the first put measures whatever earlier runs left behind
+        self.written = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, url: str, file_id) -> str:
+        digest = hashlib.sha256(f"{file_id}:{url}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, url: str, file_id):
+        path = self._path(url, file_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as the last-access time for LRU eviction across workers
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, url: str, file_id, data: bytes):
+        if len(data) > self.max_entry:
+            return
+        path = self._path(url, file_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file in the same directory and rename, so readers in
+        # any worker see either the whole blob or nothing
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self.lock:
+            self.written += len(data)
+            due = self.written >= self.max_bytes // 10
+            if due:
+                self.written = 0
+        if due:
+            self.evict()
+
+    def invalidate(self, url: str, file_id):
+        try:
+            os.unlink(self._path(url, file_id))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # temp files left by a crashed writer
+                if name.startswith(".tmp-"):
+                    if now - stat.st_mtime > 3600:
+                        self._unlink(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        # trim to 90% so eviction does not run on every put near the bound
+        target = self.max_bytes * 9 // 10
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            self._unlink(path)
+            total -= size
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+blob_cache = BlobCache(BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES, BLOB_CACHE_MAX_ENTRY)
+
+
+async def fetch_blob(url: str, file_id) -> bytes:
+    if not blob_cache.enabled:
+        response = await fetch("GET", url)
+        response.raise_for_status()
+        return response.content
+
+    data = await asyncio.to_thread(blob_cache.get, url, file_id)
+    if data is not None:
+        return data
+
+    response = await fetch("GET", url)
+    response.raise_for_status()
+    data = response.content
+    try:
+        await asyncio.to_thread(blob_cache.put, url, file_id, data)
+    except OSError as e:
+        print(f"Blob cache write failed: {e}")
+    return data
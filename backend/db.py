@@ -1,15 +1,179 @@
 import os
+import time
+import threading
+import asyncio
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import pool as pg_pool
+from psycopg2 import extensions
 from dotenv import load_dotenv
 from contextlib import contextmanager
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# seconds a caller waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# connections idle longer than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+# connections older than this are closed and replaced
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+# concurrent streamed exports; each holds its own connection outside the pool
+DB_EXPORT_MAX = int(os.getenv("DB_EXPORT_MAX", "2"))
+
+# psycopg2's ThreadedConnectionPool closes every connection returned beyond
+# minconn, so idle connections are kept here instead and reused LIFO
+_idle = []
+_idle_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+# one worker per pooled connection, so queries queue here instead of on the event loop
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+
+
+class PooledConnection(extensions.connection):
+    # kept on the connection itself so they go away with it
+    created_at = 0.0
+    released_at = 0.0
+
+
+def _connect():
+    conn = psycopg2.connect(DATABASE_URL, connection_factory=PooledConnection)
+    conn.created_at = conn.released_at = time.monotonic()
+    return conn
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+
+    now = time.monotonic()
+    if now - conn.created_at > DB_POOL_RECYCLE:
+        return False
+
+    if now - conn.released_at > DB_POOL_PING_AFTER:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+def _discard(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def warm_pool():
+    # opens DB_POOL_MIN connections up front so the first requests skip the handshake
+    conns = []
+    try:
+        for _ in range(DB_POOL_MIN):
+            conns.append(acquire())
+    finally:
+        for conn in conns:
+            release(conn)
+
+
+def acquire():
+    # a slot is held for every checked-out connection, so at most DB_POOL_MAX are open
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise pg_pool.PoolError("Timed out waiting for a database connection")
+
+    try:
+        while True:
+            with _idle_lock:
+                conn = _idle.pop() if _idle else None
+            if conn is None:
+                return _connect()
+            if _is_healthy(conn):
+                return conn
+            _discard(conn)
+    except Exception:
+        _slots.release()
+        raise
+
+
+def release(conn):
+    try:
+        if conn.closed:
+            return
+
+        # callers that raise before committing leave a transaction open
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                _discard(conn)
+                return
+
+        conn.released_at = time.monotonic()
+        with _idle_lock:
+            _idle.append(conn)
+    finally:
+        _slots.release()
+
+
 @contextmanager
 def get_db():
-    conn = psycopg2.connect(DATABASE_URL)
+    conn = acquire()
     try:
         yield conn
     finally:
-        conn.close()
+        release(conn)
+
+
+# async face: runs func(conn, *args) on a worker thread with a pooled connection
+async def run_db(func, *args):
+    def task():
+        with get_db() as conn:
+            return func(conn, *args)
+
+    return await asyncio.get_running_loop().run_in_executor(_executor, task)
+
+
+# streams rows from a server-side cursor on a dedicated connection, so a slow
+# client reading an export never holds one of the request pool's connections
+_export_slots = threading.BoundedSemaphore(DB_EXPORT_MAX)
+
+
+async def stream_rows(query, params=(), batch_size=1000):
+    if not _export_slots.acquire(blocking=False):
+        raise pg_pool.PoolError("Too many exports in progress")
+
+    # blocking calls go to asyncio's default threads, not the pool-sized DB executor
+    try:
+        conn = await asyncio.to_thread(_connect)
+    except BaseException:
+        _export_slots.release()
+        raise
+
+    cursor = conn.cursor(name=f"stream_{time.monotonic_ns()}")
+    cursor.itersize = batch_size
+    try:
+        await asyncio.to_thread(cursor.execute, query, params)
+        while True:
+            rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        try:
+            await asyncio.to_thread(_discard, conn)
+        finally:
+            _export_slots.release()
+
+
+def close_pool():
+    _executor.shutdown(wait=True)
+    with _idle_lock:
+        conns = _idle[:]
+        _idle.clear()
+    for conn in conns:
+        _discard(conn)
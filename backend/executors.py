@@ -0,0 +1,47 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+# smallest slice of a batch worth a round trip to a worker process
+CPU_BATCH_MIN = int(os.getenv("CPU_BATCH_MIN", "16"))
+# tasks submitted to the pool at once; callers beyond this wait on the event loop
+CPU_QUEUE_DEPTH = int(os.getenv("CPU_QUEUE_DEPTH", str(CPU_WORKERS * 8)))
+# seconds a caller waits for a queue slot before the request fails with 503
+CPU_QUEUE_TIMEOUT = float(os.getenv("CPU_QUEUE_TIMEOUT", "30"))
+
+# big-int RSA work is GIL-bound, so it runs in worker processes
+process_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+
+
+_queue_slots = None
+
+
+async def run_cpu(func, *args):
+    global _queue_slots
+    if _queue_slots is None:
+        _queue_slots = asyncio.Semaphore(CPU_QUEUE_DEPTH)
+    try:
+        await asyncio.wait_for(_queue_slots.acquire(), CPU_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server is busy, try again shortly")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(process_pool, func, *args)
+    finally:
+        _queue_slots.release()
+
+
+async def run_cpu_batched(func, shared, items, min_chunk=CPU_BATCH_MIN):
+    # func(shared, chunk) runs once per chunk, with chunks spread over the workers;
+    # results come back flattened in input order
+    if not items:
+        return []
+    size = max(min_chunk, -(-len(items) // CPU_WORKERS))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    results = await asyncio.gather(*(run_cpu(func, shared, chunk) for chunk in chunks))
+    return [result for chunk in results for result in chunk]
+
+
+def shutdown_executors():
+    process_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,124 @@
+import os
+import random
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+
+# one client for the app's lifetime so storage fetches reuse TCP/TLS connections
+STORAGE_HTTP_MAX_CONNECTIONS = int(os.getenv("STORAGE_HTTP_MAX_CONNECTIONS", "100"))
+STORAGE_HTTP_MAX_KEEPALIVE = int(os.getenv("STORAGE_HTTP_MAX_KEEPALIVE", "20"))
+STORAGE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("STORAGE_HTTP_KEEPALIVE_EXPIRY", "60"))
+# requests in flight to a single host; further callers wait for a slot
+STORAGE_HTTP_PER_HOST = int(os.getenv("STORAGE_HTTP_PER_HOST", "32"))
+# separate cap for long uploads, so they cannot take every slot above
+STORAGE_HTTP_BULK_PER_HOST = int(os.getenv("STORAGE_HTTP_BULK_PER_HOST", "16"))
+# seconds a single socket read or write may stall before it fails (and is retried)
+STORAGE_HTTP_READ_TIMEOUT = float(os.getenv("STORAGE_HTTP_READ_TIMEOUT", "60"))
+STORAGE_HTTP_WRITE_TIMEOUT = float(os.getenv("STORAGE_HTTP_WRITE_TIMEOUT", "60"))
+STORAGE_HTTP_RETRIES = int(os.getenv("STORAGE_HTTP_RETRIES", "3"))
+STORAGE_HTTP_BACKOFF = float(os.getenv("STORAGE_HTTP_BACKOFF", "0.2"))
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+STORAGE_HTTP2 = os.getenv("STORAGE_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+RETRY_STATUSES = {429, 502, 503, 504}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+_client = None
+_host_slots = {}
+_bulk_slots = {}
+
+
+def start_http_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=STORAGE_HTTP2,
+            timeout=httpx.Timeout(30.0, read=STORAGE_HTTP_READ_TIMEOUT, write=STORAGE_HTTP_WRITE_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=STORAGE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=STORAGE_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=STORAGE_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_slots.clear()
+    _bulk_slots.clear()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # started lazily too, so scripts that never run the lifespan still work
+    return _client or start_http_client()
+
+
+def _host_slot(url: str, bulk: bool = False) -> asyncio.Semaphore:
+    slots, limit = (_bulk_slots, STORAGE_HTTP_BULK_PER_HOST) if bulk else (_host_slots, STORAGE_HTTP_PER_HOST)
+    host = urlsplit(str(url)).netloc
+    slot = slots.get(host)
+    if slot is None:
+        slot = slots[host] = asyncio.Semaphore(limit)
+    return slot
+
+
+async def _backoff(attempt: int):
+    # full jitter: a random wait up to the exponential cap
+    await asyncio.sleep(random.uniform(0, STORAGE_HTTP_BACKOFF * (2 ** attempt)))
+
+
+async def fetch(method: str, url: str, retry: bool = True, bulk: bool = False, **kwargs) -> httpx.Response:
+    # bulk: a long transfer such as a streamed upload, counted against its own cap
+    attempts = STORAGE_HTTP_RETRIES + 1 if retry else 1
+    async with _host_slot(url, bulk):
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = await get_http_client().request(method, url, **kwargs)
+            except RETRY_ERRORS:
+                if last:
+                    raise
+                await _backoff(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and not last:
+                await _backoff(attempt)
+                continue
+            return response
+
+
+async def delete(url: str, **kwargs) -> httpx.Response:
+    # deletes are idempotent, so they take the normal retries and host slot
+    return await fetch("DELETE", url, **kwargs)
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs):
+    # retried only until the response starts; the body is never replayed.
+    # The slot is released once headers arrive: the body is read at the
+    # caller's pace and must not hold up other storage requests.
+    async with _host_slot(url):
+        for attempt in range(STORAGE_HTTP_RETRIES + 1):
+            last = attempt == STORAGE_HTTP_RETRIES
+            try:
+                request = get_http_client().build_request(method, url, **kwargs)
+                response = await get_http_client().send(request, stream=True)
+            except RETRY_ERRORS:
+                if last:
+                    raise
+                await _backoff(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and not last:
+                await response.aclose()
+                await _backoff(attempt)
+                continue
+            break
+    try:
+        yield response
+    finally:
+        await response.aclose()
@@ -0,0 +1,59 @@
+import os
+import asyncio
+from collections import deque
+
+from executors import run_cpu
+from utils.rsa import generate_rsa_keys
+
+RSA_KEY_BITS = 2048
+# number of pre-generated keypairs kept ready for /auth/register; 0 disables the reservoir
+KEY_RESERVOIR_SIZE = int(os.getenv("KEY_RESERVOIR_SIZE", "0"))
+
+_reservoir = deque()
+_refill_needed = None
+_refill_task = None
+
+
+async def _refill_loop():
+    while True:
+        try:
+            while len(_reservoir) < KEY_RESERVOIR_SIZE:
+                _reservoir.append(await run_cpu(generate_rsa_keys, RSA_KEY_BITS))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Key reservoir refill failed: {e}")
+            await asyncio.sleep(5)
+            continue
+
+        _refill_needed.clear()
+        await _refill_needed.wait()
+
+
+def start_key_reservoir():
+    global _refill_needed, _refill_task
+    if KEY_RESERVOIR_SIZE <= 0 or _refill_task is not None:
+        return
+    _refill_needed = asyncio.Event()
+    _refill_task = asyncio.create_task(_refill_loop())
+
+
+async def stop_key_reservoir():
+    global _refill_task
+    if _refill_task is None:
+        return
+    _refill_task.cancel()
+    try:
+        await _refill_task
+    except asyncio.CancelledError:
+        pass
+    _refill_task = None
+    _reservoir.clear()
+
+
+async def new_rsa_keypair():
+    if _reservoir:
+        keypair = _reservoir.popleft()
+        _refill_needed.set()
+        return keypair
+    return await run_cpu(generate_rsa_keys, RSA_KEY_BITS)
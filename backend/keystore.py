@@ -0,0 +1,180 @@
+import os
+import sys
+from dotenv import load_dotenv, dotenv_values, set_key, unset_key
+from Cryptodome.Cipher import AES
+from Cryptodome.Random import get_random_bytes
+
+from db import get_db
+
+load_dotenv()
+
+# "postgres" keeps keys in the user_keys table; "env" is the legacy .env file store
+KEY_STORE_BACKEND = os.getenv("KEY_STORE_BACKEND", "postgres")
+ENV_FILE = ".env"
+# 32-byte hex key that wraps user_keys.aes_key, so a database dump alone cannot
+# open the private keys; keep it outside the database (env, secrets manager)
+KEY_STORE_MASTER_KEY = os.getenv("KEY_STORE_MASTER_KEY")
+WRAPPED_PREFIX = "mk1:"
+
+
+def env_key_prefix(email: str) -> str:
+    return f"USER_{email.upper().replace('@', '_').replace('.', '_')}"
+
+
+def load_master_key() -> bytes:
+    if not KEY_STORE_MASTER_KEY:
+        raise RuntimeError("KEY_STORE_MASTER_KEY must be set for the postgres key store")
+    master_key = bytes.fromhex(KEY_STORE_MASTER_KEY)
+    if len(master_key) != 32:
+        raise ValueError("KEY_STORE_MASTER_KEY must be 64 hex characters")
+    return master_key
+
+
+def wrap_aes_key(master_key: bytes, user_id, aes_key_hex: str) -> str:
+    # AES-GCM bound to the user id, so a wrapped key cannot be moved to another row
+    cipher = AES.new(master_key, AES.MODE_GCM, nonce=get_random_bytes(12))
+    cipher.update(str(user_id).encode())
+    ciphertext, tag = cipher.encrypt_and_digest(aes_key_hex.encode())
+    return WRAPPED_PREFIX + (cipher.nonce + tag + ciphertext).hex()
+
+
+def unwrap_aes_key(master_key: bytes, user_id, stored: str) -> str:
+    blob = bytes.fromhex(stored[len(WRAPPED_PREFIX):])
+    cipher = AES.new(master_key, AES.MODE_GCM, nonce=blob[:12])
+    cipher.update(str(user_id).encode())
+    return cipher.decrypt_and_verify(blob[28:], blob[12:28]).decode()
+
+
+class EnvKeyStore:
+    def get_keys(self, user_id, email: str):
+        prefix = env_key_prefix(email)
+        encrypted_private_key = os.getenv(f"{prefix}_ENCRYPTED_PRIVATE_KEY")
+        aes_key_hex = os.getenv(f"{prefix}_AES_KEY")
+        if not encrypted_private_key or not aes_key_hex:
+            return None
+        return encrypted_private_key, aes_key_hex
+
+    def save_keys(self, user_id, email: str, encrypted_private_key: str, aes_key_hex: str, conn=None):
+        prefix = env_key_prefix(email)
+        set_key(ENV_FILE, f"{prefix}_ENCRYPTED_PRIVATE_KEY", encrypted_private_key)
+        set_key(ENV_FILE, f"{prefix}_AES_KEY", aes_key_hex)
+        os.environ[f"{prefix}_ENCRYPTED_PRIVATE_KEY"] = encrypted_private_key
+        os.environ[f"{prefix}_AES_KEY"] = aes_key_hex
+
+
+class PostgresKeyStore:
+    def __init__(self, legacy_store=None, master_key: bytes = None):
+        # users registered before the table existed are read from .env and copied over once
+        self.legacy_store = legacy_store
+        self.master_key = master_key or load_master_key()
+
+    def get_keys(self, user_id, email: str):
+        with get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT encrypted_private_key, aes_key FROM user_keys WHERE user_id = %s",
+                    (user_id,)
+                )
+                row = cursor.fetchone()
+        if row:
+            encrypted_private_key, stored = row
+            if not stored.startswith(WRAPPED_PREFIX):
+                # written before keys were wrapped; rewrite it wrapped now
+                self.save_keys(user_id, email, encrypted_private_key, stored)
+                return encrypted_private_key, stored
+            return encrypted_private_key, unwrap_aes_key(self.master_key, user_id, stored)
+
+        if self.legacy_store is None:
+            return None
+        keys = self.legacy_store.get_keys(user_id, email)
+        if keys:
+            self.save_keys(user_id, email, *keys)
+        return keys
+
+    def save_keys(self, user_id, email: str, encrypted_private_key: str, aes_key_hex: str, conn=None):
+        statement = """
+            INSERT INTO user_keys (user_id, encrypted_private_key, aes_key)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_id) DO UPDATE
+            SET encrypted_private_key = EXCLUDED.encrypted_private_key,
+                aes_key = EXCLUDED.aes_key,
+                updated_at = NOW()
+        """
+        wrapped = wrap_aes_key(self.master_key, user_id, aes_key_hex)
+        if conn is not None:
+            with conn.cursor() as cursor:
+                cursor.execute(statement, (user_id, encrypted_private_key, wrapped))
+            return
+
+        with get_db() as own_conn:
+            with own_conn.cursor() as cursor:
+                cursor.execute(statement, (user_id, encrypted_private_key, wrapped))
+            own_conn.commit()
+
+
+def _create_key_store():
+    if KEY_STORE_BACKEND == "env":
+        return EnvKeyStore()
+    if KEY_STORE_BACKEND == "postgres":
+        return PostgresKeyStore(legacy_store=EnvKeyStore())
+    raise ValueError(f"Unknown KEY_STORE_BACKEND '{KEY_STORE_BACKEND}'")
+
+
+key_store = _create_key_store()
+
+
+def migrate_env_keys(prune: bool = False) -> int:
+    env_entries = dotenv_values(ENV_FILE)
+    store = PostgresKeyStore()
+    migrated = 0
+
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, email FROM users")
+            users = cursor.fetchall()
+
+        for user_id, email in users:
+            prefix = env_key_prefix(email)
+            encrypted_private_key = env_entries.get(f"{prefix}_ENCRYPTED_PRIVATE_KEY")
+            aes_key_hex = env_entries.get(f"{prefix}_AES_KEY")
+            if not encrypted_private_key or not aes_key_hex:
+                continue
+            store.save_keys(user_id, email, encrypted_private_key, aes_key_hex, conn=conn)
+            migrated += 1
+        conn.commit()
+
+    if prune:
+        for user_id, email in users:
+            prefix = env_key_prefix(email)
+            for suffix in ("_ENCRYPTED_PRIVATE_KEY", "_AES_KEY"):
+                if f"{prefix}{suffix}" in env_entries:
+                    unset_key(ENV_FILE, f"{prefix}{suffix}")
+    return migrated
+
+
+def wrap_stored_keys() -> int:
+    # wraps rows written before KEY_STORE_MASTER_KEY existed; get_keys also
+    # does this lazily, but rows of inactive users would otherwise stay plain
+    store = PostgresKeyStore()
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT user_id, encrypted_private_key, aes_key FROM user_keys WHERE aes_key NOT LIKE %s FOR UPDATE",
+                (WRAPPED_PREFIX + "%",)
+            )
+            rows = cursor.fetchall()
+        for user_id, encrypted_private_key, aes_key_hex in rows:
+            store.save_keys(user_id, None, encrypted_private_key, aes_key_hex, conn=conn)
+        conn.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    # python keystore.py migrate-env [--prune] | wrap-keys
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate-env":
+        count = migrate_env_keys(prune="--prune" in sys.argv[2:])
+        print(f"Migrated keys for {count} users")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "wrap-keys":
+        print(f"Wrapped keys for {wrap_stored_keys()} users")
+    else:
+        raise SystemExit("usage: python keystore.py migrate-env [--prune] | wrap-keys")
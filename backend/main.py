@@ -1,11 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routers import auth
 from routers import files
 from routers import share
 from routers import admin
+from db import close_pool, warm_pool
+from migrations import apply_migrations
+from executors import shutdown_executors
+from keygen import start_key_reservoir, stop_key_reservoir
+from audit_log import start_audit_writer, stop_audit_writer
+from http_client import start_http_client, close_http_client
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    apply_migrations()
+    warm_pool()
+    start_http_client()
+    start_key_reservoir()
+    start_audit_writer()
+    try:
+        yield
+    finally:
+        await stop_key_reservoir()
+        shutdown_executors()
+        # flush queued activity rows before the pool goes away
+        stop_audit_writer()
+        await close_http_client()
+        close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,4 +44,4 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(files.router, prefix="/files", tags=["Files"])
 app.include_router(share.router, prefix="/share", tags=["Share"])
-app.include_router(admin.router, prefix="/admin", tags=["Admin"])
\ No newline at end of file
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
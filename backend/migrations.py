@@ -0,0 +1,269 @@
+import re
+import threading
+import psycopg2
+from db import get_db, DATABASE_URL
+
+TRGM_EMAIL_INDEX = "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_trgm_idx ON users USING gin (email gin_trgm_ops)"
+
+
+def _trigram_email_index(cursor):
+    # optional: without pg_trgm user_search falls back to its in-process index
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except psycopg2.Error as e:
+        print(f"pg_trgm unavailable, skipping the trigram email index: {e}")
+        return
+    _execute(cursor, TRGM_EMAIL_INDEX)
+
+
+# (version, description, statements[, online]) - append only; applied versions
+# are recorded in schema_migrations so each statement runs once per database.
+# A statement may also be a callable taking the cursor.
+# Online migrations run in autocommit mode on a background thread after
+# startup, so they can use CREATE INDEX CONCURRENTLY without blocking writes
+# or holding up the app. Keep them to indexes and other objects that nothing
+# depends on, since later migrations may be applied before they finish.
+MIGRATIONS = [
+    (1, "files: size, content hash and upload time", [
+        "ALTER TABLE files ADD COLUMN IF NOT EXISTS file_size BIGINT",
+        "ALTER TABLE files ADD COLUMN IF NOT EXISTS content_sha256 TEXT",
+        "ALTER TABLE files ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()",
+    ]),
+    (2, "user_keys: per-user key store", [
+        """
+        CREATE TABLE IF NOT EXISTS user_keys (
+            user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            encrypted_private_key TEXT NOT NULL,
+            aes_key TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """,
+    ]),
+    (3, "user_activity_log: structured share references", [
+        "ALTER TABLE user_activity_log ADD COLUMN IF NOT EXISTS file_id BIGINT",
+        "ALTER TABLE user_activity_log ADD COLUMN IF NOT EXISTS recipient_id BIGINT",
+    ]),
+    (4, "user_stats: per-user upload/share counters kept by triggers", [
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            upload_count BIGINT NOT NULL DEFAULT 0,
+            share_count BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION user_stats_bump(target BIGINT, uploads BIGINT, shares BIGINT)
+        RETURNS VOID AS $$
+        BEGIN
+            IF target IS NULL THEN
+                RETURN;
+            END IF;
+            INSERT INTO user_stats (user_id, upload_count, share_count)
+            VALUES (target, uploads, shares)
+            ON CONFLICT (user_id) DO UPDATE
+            SET upload_count = user_stats.upload_count + EXCLUDED.upload_count,
+                share_count = user_stats.share_count + EXCLUDED.share_count;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION user_stats_on_files() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM user_stats_bump(NEW.owner_id, 1, 0);
+                RETURN NEW;
+            END IF;
+            -- shares of the file disappear with it (cascade or explicit delete)
+            PERFORM user_stats_bump(
+                OLD.owner_id, -1,
+                -(SELECT COUNT(*) FROM shared_files WHERE file_id = OLD.id)
+            );
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION user_stats_on_shared_files() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM user_stats_bump((SELECT owner_id FROM files WHERE id = NEW.file_id), 0, 1);
+                RETURN NEW;
+            END IF;
+            -- no owner row means the file itself is being deleted and was already accounted for
+            PERFORM user_stats_bump((SELECT owner_id FROM files WHERE id = OLD.file_id), 0, -1);
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS user_stats_files ON files",
+        """
+        CREATE TRIGGER user_stats_files
+        BEFORE INSERT OR DELETE ON files
+        FOR EACH ROW EXECUTE FUNCTION user_stats_on_files()
+        """,
+        "DROP TRIGGER IF EXISTS user_stats_shared_files ON shared_files",
+        """
+        CREATE TRIGGER user_stats_shared_files
+        AFTER INSERT OR DELETE ON shared_files
+        FOR EACH ROW EXECUTE FUNCTION user_stats_on_shared_files()
+        """,
+        """
+        INSERT INTO user_stats (user_id, upload_count, share_count)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM files f WHERE f.owner_id = u.id),
+               (SELECT COUNT(*) FROM shared_files sf JOIN files f ON f.id = sf.file_id WHERE f.owner_id = u.id)
+        FROM users u
+        ON CONFLICT (user_id) DO UPDATE
+        SET upload_count = EXCLUDED.upload_count,
+            share_count = EXCLUDED.share_count
+        """,
+    ]),
+    (5, "rate_limit_*: shared sliding windows for RATE_LIMIT_BACKEND=postgres", [
+        """
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_counters (
+            scope TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            window_start BIGINT NOT NULL,
+            hits INT NOT NULL,
+            PRIMARY KEY (scope, subject, window_start)
+        )
+        """,
+        """
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_members (
+            scope TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            member TEXT NOT NULL,
+            hit_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (scope, subject, member)
+        )
+        """,
+    ]),
+    (6, "indexes for the router query predicates", [
+        # files: owner listings in every /my-files sort order, lookups by (file_name, owner_id)
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS files_owner_created_idx ON files (owner_id, created_at, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS files_owner_name_idx ON files (owner_id, file_name, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS files_owner_size_idx ON files (owner_id, (COALESCE(file_size, 0)), id)",
+        # shared_files: recipient listings and the share lookups by file
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS shared_files_recipient_idx ON shared_files (shared_with, file_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS shared_files_file_idx ON shared_files (file_id)",
+        # user_activity_log: per-user windows, newest-first pages and action/date filters
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_user_action_created_idx ON user_activity_log (user_id, action, created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_created_idx ON user_activity_log (created_at DESC, id DESC)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_action_created_idx ON user_activity_log (action, created_at DESC, id DESC)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_user_created_idx ON user_activity_log (user_id, created_at DESC, id DESC)",
+        # users: email lookups, role listings, locked users and substring search
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_idx ON users (email)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_role_email_idx ON users (role, email, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_locked_idx ON users (id) WHERE is_locked",
+        _trigram_email_index,
+    ], True),
+]
+
+# serializes migration runs when several workers start at once
+MIGRATION_LOCK_ID = 7421030
+# held by the one worker building online migrations; the others skip them
+ONLINE_MIGRATION_LOCK_ID = 7421031
+
+CONCURRENT_INDEX = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)", re.IGNORECASE)
+
+
+def _is_online(migration) -> bool:
+    return len(migration) > 3 and migration[3]
+
+
+def _execute(cursor, statement):
+    if callable(statement):
+        statement(cursor)
+        return
+    match = CONCURRENT_INDEX.match(statement.strip())
+    if match:
+        # a failed concurrent build leaves an invalid index that IF NOT EXISTS would keep
+        cursor.execute("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s AND NOT i.indisvalid
+        """, (match.group(1),))
+        if cursor.fetchone():
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+    cursor.execute(statement)
+
+
+def apply_online_migrations():
+    # its own connection, so a long build does not hold a pool slot
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (ONLINE_MIGRATION_LOCK_ID,))
+            if not cursor.fetchone()[0]:
+                return
+
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {r[0] for r in cursor.fetchall()}
+            for migration in MIGRATIONS:
+                version, description, statements = migration[:3]
+                if version in applied or not _is_online(migration):
+                    continue
+                for statement in statements:
+                    _execute(cursor, statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (version, description)
+                )
+                print(f"Applied online migration {version}: {description}")
+    except Exception as e:
+        print(f"Online migrations failed, retrying on next start: {e}")
+    finally:
+        # closing the session also releases the advisory lock
+        conn.close()
+
+
+def apply_migrations(background: bool = True):
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                """)
+                conn.commit()
+
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {r[0] for r in cursor.fetchall()}
+
+                online_pending = False
+                for migration in MIGRATIONS:
+                    version, description, statements = migration[:3]
+                    if version in applied:
+                        continue
+                    if _is_online(migration):
+                        online_pending = True
+                        continue
+                    for statement in statements:
+                        _execute(cursor, statement)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    conn.commit()
+
+                # let PostgREST (supabase.table) pick up new columns
+                cursor.execute("NOTIFY pgrst, 'reload schema'")
+                conn.commit()
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+
+    if online_pending:
+        if background:
+            threading.Thread(target=apply_online_migrations, name="online-migrations", daemon=True).start()
+        else:
+            apply_online_migrations()
+
+
+if __name__ == "__main__":
+    apply_migrations(background=False)
@@ -0,0 +1,150 @@
+import os
+import math
+import time
+import threading
+from collections import deque, OrderedDict
+
+from db import get_db
+
+# "memory" keeps windows in this process; "postgres" shares them across workers
+# through the unlogged rate_limit_* tables
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+
+UPLOAD_LIMIT = 100
+SHARE_LIMIT = 50
+FAILED_LOGIN_LIMIT = 3
+
+
+class MemoryRateLimiter:
+    def __init__(self, window: int = RATE_LIMIT_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        # (scope, subject) -> deque of hit times, or OrderedDict member -> last hit time
+        self.hits = {}
+        self.members = {}
+        self.calls = 0
+
+    def hit(self, scope: str, subject, member=None, conn=None) -> int:
+        now = time.monotonic()
+        cutoff = now - self.window
+        key = (scope, subject)
+        with self.lock:
+            self._maybe_sweep(cutoff)
+
+            if member is None:
+                times = self.hits.setdefault(key, deque())
+                while times and times[0] <= cutoff:
+                    times.popleft()
+                times.append(now)
+                return len(times)
+
+            # distinct members in the window, oldest first
+            seen = self.members.setdefault(key, OrderedDict())
+            while seen and next(iter(seen.values())) <= cutoff:
+                seen.popitem(last=False)
+            seen[member] = now
+            seen.move_to_end(member)
+            return len(seen)
+
+    def active_members(self, scope: str, subject, conn=None) -> set:
+        cutoff = time.monotonic() - self.window
+        with self.lock:
+            seen = self.members.get((scope, subject), {})
+            return {m for m, t in seen.items() if t > cutoff}
+
+    def reset(self, subject):
+        with self.lock:
+            for store in (self.hits, self.members):
+                for key in [k for k in store if k[1] == subject]:
+                    del store[key]
+
+    def _maybe_sweep(self, cutoff: float):
+        # drop idle subjects now and then so the maps do not grow without bound
+        self.calls += 1
+        if self.calls % 1000:
+            return
+        for key in [k for k, v in self.hits.items() if not v or v[-1] <= cutoff]:
+            del self.hits[key]
+        for key in [k for k, v in self.members.items() if not v or next(reversed(v.values())) <= cutoff]:
+            del self.members[key]
+
+
+class PostgresRateLimiter:
+    # counts use a sliding-window counter (current + weighted previous fixed window);
+    # distinct members are kept one row each and pruned as they expire
+    def __init__(self, window: int = RATE_LIMIT_WINDOW):
+        self.window = window
+
+    def hit(self, scope: str, subject, member=None, conn=None) -> int:
+        if conn is None:
+            with get_db() as own_conn:
+                count = self._hit(own_conn, scope, subject, member)
+                own_conn.commit()
+                return count
+        return self._hit(conn, scope, subject, member)
+
+    def _hit(self, conn, scope, subject, member):
+        subject = str(subject)
+        with conn.cursor() as cursor:
+            if member is not None:
+                cursor.execute("""
+                    DELETE FROM rate_limit_members
+                    WHERE scope = %s AND subject = %s AND hit_at < NOW() - make_interval(secs => %s)
+                """, (scope, subject, self.window))
+                cursor.execute("""
+                    INSERT INTO rate_limit_members (scope, subject, member, hit_at)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (scope, subject, member) DO UPDATE SET hit_at = EXCLUDED.hit_at
+                """, (scope, subject, str(member)))
+                cursor.execute(
+                    "SELECT COUNT(*) FROM rate_limit_members WHERE scope = %s AND subject = %s",
+                    (scope, subject)
+                )
+                return cursor.fetchone()[0]
+
+            now = time.time()
+            current = int(now // self.window) * self.window
+            previous = current - self.window
+            cursor.execute("""
+                INSERT INTO rate_limit_counters (scope, subject, window_start, hits)
+                VALUES (%s, %s, %s, 1)
+                ON CONFLICT (scope, subject, window_start)
+                DO UPDATE SET hits = rate_limit_counters.hits + 1
+                RETURNING hits
+            """, (scope, subject, current))
+            current_hits = cursor.fetchone()[0]
+            cursor.execute("""
+                DELETE FROM rate_limit_counters
+                WHERE scope = %s AND subject = %s AND window_start < %s
+            """, (scope, subject, previous))
+            cursor.execute("""
+                SELECT hits FROM rate_limit_counters
+                WHERE scope = %s AND subject = %s AND window_start = %s
+            """, (scope, subject, previous))
+            row = cursor.fetchone()
+            previous_hits = row[0] if row else 0
+
+        overlap = 1 - (now - current) / self.window
+        return current_hits + math.floor(previous_hits * overlap)
+
+    def active_members(self, scope: str, subject, conn=None) -> set:
+        if conn is None:
+            with get_db() as own_conn:
+                return self.active_members(scope, subject, own_conn)
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT member FROM rate_limit_members
+                WHERE scope = %s AND subject = %s AND hit_at >= NOW() - make_interval(secs => %s)
+            """, (scope, str(subject), self.window))
+            return {r[0] for r in cursor.fetchall()}
+
+    def reset(self, subject):
+        with get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM rate_limit_counters WHERE subject = %s", (str(subject),))
+                cursor.execute("DELETE FROM rate_limit_members WHERE subject = %s", (str(subject),))
+            conn.commit()
+
+
+rate_limiter = PostgresRateLimiter() if RATE_LIMIT_BACKEND == "postgres" else MemoryRateLimiter()
@@ -1,18 +1,135 @@
 from fastapi import APIRouter, UploadFile, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from Cryptodome.Cipher import AES
 from Cryptodome.Random import get_random_bytes
 from supabase_client import supabase
-from utils.aes import decrypt_private_key
+from user_keys import invalidate_private_key, private_key_cache
+from ratelimit import rate_limiter
+import user_search
 from utils.rsa import encrypt_rsa, decrypt_rsa
 from utils.jwt_handler import verify_token
-from db import get_db
+from db import run_db, stream_rows
+from psycopg2.pool import PoolError
+from utils.pagination import encode_cursor, decode_cursor
+import io
+import os
+import asyncio
+import csv
+import json
+import time
 from datetime import datetime
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
+# Share rows carry file_id/recipient_id since they were written; rows logged
+# before that only have the recipient email in metadata and are resolved by
+# the lateral join, all in the same query as the page itself.
+ACTIVITY_SELECT = """
+    SELECT u.email, a.action, a.metadata, a.created_at,
+           COALESCE(sf_file.file_name, legacy.file_name),
+           COALESCE(sf_recipient.email, legacy.recipient_email),
+           a.id
+    FROM user_activity_log a
+    LEFT JOIN users u ON a.user_id = u.id
+    LEFT JOIN files sf_file ON sf_file.id = a.file_id
+    LEFT JOIN users sf_recipient ON sf_recipient.id = a.recipient_id
+    LEFT JOIN LATERAL (
+        SELECT f.file_name, ru.email AS recipient_email
+        FROM users ru
+        JOIN shared_files sf ON sf.shared_with = ru.id
+        JOIN files f ON f.id = sf.file_id
+        WHERE a.action = 'share' AND a.file_id IS NULL
+          AND ru.email = a.metadata AND f.owner_id = a.user_id
+        LIMIT 1
+    ) legacy ON TRUE
+"""
+
+
+def _format_activity(row) -> dict:
+    actor_email, action, metadata, timestamp, file_name, recipient_email = row[:6]
+
+    if action == 'share':
+        if file_name and recipient_email:
+            metadata_display = f"shared '{file_name}' with {recipient_email}"
+        else:
+            metadata_display = f"shared with unknown ({metadata})"
+    else:
+        metadata_display = metadata
+
+    return {
+        "email": actor_email,
+        "action": action,
+        "metadata": metadata_display,
+        "timestamp": timestamp.isoformat()
+    }
+
+
+# totals are advisory in the admin UI, so they are cached briefly instead of
+# re-counted on every page
+ADMIN_COUNT_CACHE_TTL = float(os.getenv("ADMIN_COUNT_CACHE_TTL", "30"))
+ADMIN_COUNT_CACHE_SIZE = 1024
+# above this many rows the planner's estimate is used instead of COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 100_000
+_count_cache = {}
+
+# /admin/stats is auto-refreshed by the dashboard; serve it from memory for this long
+ADMIN_STATS_CACHE_TTL = float(os.getenv("ADMIN_STATS_CACHE_TTL", "10"))
+_stats_cache = {}
+
+
+def _cached_count(cursor, key, query, params=()):
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    cursor.execute(query, params)
+    total = cursor.fetchone()[0]
+    if len(_count_cache) >= ADMIN_COUNT_CACHE_SIZE:
+        _count_cache.clear()
+    _count_cache[key] = (total, now + ADMIN_COUNT_CACHE_TTL)
+    return total
+
+
+def _estimated_count(cursor, table: str):
+    cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = %s::regclass", (table,))
+    row = cursor.fetchone()
+    if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+        return row[0]
+    return _cached_count(cursor, table, f"SELECT COUNT(*) FROM {table}")
+
+
+def _keyset(cursor: Optional[str], columns: list, operator: str):
+    if not cursor:
+        return "", []
+    values = decode_cursor(cursor, len(columns))
+    if columns[0].endswith("created_at"):
+        try:
+            values[0] = datetime.fromisoformat(values[0])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    placeholders = ", ".join(["%s"] * len(columns))
+    return f"AND ({', '.join(columns)}) {operator} ({placeholders})", values
+
+
+def _keyset_after(cursor: Optional[str], columns: list):
+    return _keyset(cursor, columns, ">")
+
+
+def _keyset_before(cursor: Optional[str], columns: list):
+    return _keyset(cursor, columns, "<")
+
+
+def _split_page(rows: list, limit: int, cursor_values):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*cursor_values(rows[-1]))
+
+
 @router.get("/stats")
 async def get_admin_stats(authorization: str = Header(...)):
     try:
@@ -21,39 +138,32 @@ async def get_admin_stats(authorization: str = Header(...)):
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT COUNT(*) FROM files")
-                total_uploads = cursor.fetchone()[0]
-
-                cursor.execute("SELECT COUNT(*) FROM shared_files")
-                total_shares = cursor.fetchone()[0]
+        now = time.monotonic()
+        if _stats_cache and _stats_cache["expires_at"] > now:
+            return _stats_cache["response"]
 
+        def fetch_stats(conn):
+            with conn.cursor() as cursor:
+                # user_stats is kept current by triggers on files/shared_files
                 cursor.execute("""
-                    SELECT u.email, COUNT(f.id) as upload_count
+                    SELECT u.email, u.role, COALESCE(s.upload_count, 0), COALESCE(s.share_count, 0)
                     FROM users u
-                    LEFT JOIN files f ON u.id = f.owner_id
-                    WHERE u.role = 'user'
-                    GROUP BY u.email
+                    LEFT JOIN user_stats s ON s.user_id = u.id
                 """)
-                upload_per_user = cursor.fetchall()
+                return cursor.fetchall()
 
-                cursor.execute("""
-                    SELECT u.email, COUNT(sf.id) as shared_count
-                    FROM users u
-                    LEFT JOIN files f ON u.id = f.owner_id
-                    LEFT JOIN shared_files sf ON f.id = sf.file_id
-                    WHERE u.role = 'user'
-                    GROUP BY u.email
-                """)
-                share_per_user = cursor.fetchall()
+        rows = await run_db(fetch_stats)
 
-        return {
-            "total_uploads": total_uploads,
-            "total_shares": total_shares,
-            "uploads_per_user": upload_per_user,
-            "shares_per_user": share_per_user
+        response = {
+            "total_uploads": sum(r[2] for r in rows),
+            "total_shares": sum(r[3] for r in rows),
+            "uploads_per_user": [(r[0], r[2]) for r in rows if r[1] == "user"],
+            "shares_per_user": [(r[0], r[3]) for r in rows if r[1] == "user"],
+            "as_of": datetime.now(timezone.utc).isoformat(),
+            "max_staleness_seconds": ADMIN_STATS_CACHE_TTL
         }
+        _stats_cache.update(response=response, expires_at=now + ADMIN_STATS_CACHE_TTL)
+        return response
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -62,8 +172,9 @@ async def get_admin_stats(authorization: str = Header(...)):
 @router.get("/users")
 async def get_all_users(
     authorization: str = Header(...),
-    page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True)
 ):
     try:
         token = authorization.split(" ")[1]
@@ -72,94 +183,131 @@ async def get_all_users(
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        offset = (page - 1) * limit
+        keyset_filter, keyset_params = _keyset_after(cursor, ["email", "id"])
 
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'user'")
-                total_users = cursor.fetchone()[0]
+        def fetch_users(conn):
+            with conn.cursor() as cur:
+                total_users = _cached_count(
+                    cur, "users", "SELECT COUNT(*) FROM users WHERE role = 'user'"
+                ) if include_total else None
 
-                cursor.execute("""
+                cur.execute(f"""
                     SELECT id, email
                     FROM users
-                    WHERE role = 'user'
-                    ORDER BY email
-                    LIMIT %s OFFSET %s
-                """, (limit, offset))
-                users = cursor.fetchall()
+                    WHERE role = 'user' {keyset_filter}
+                    ORDER BY email, id
+                    LIMIT %s
+                """, keyset_params + [limit + 1])
+                return total_users, cur.fetchall()
+
+        total_users, users = await run_db(fetch_users)
+        users, next_cursor = _split_page(users, limit, lambda u: (u[1], u[0]))
 
         return {
             "message": "Users retrieved successfully",
-            "page": page,
             "limit": limit,
             "total": total_users,
+            "next_cursor": next_cursor,
             "users": [{"id": u[0], "email": u[1]} for u in users]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+ACTIVITY_EXPORT_FIELDS = ["email", "action", "metadata", "timestamp"]
+
+
+async def _export_activity(query: str, params: list, export_format: str):
+    async for rows in stream_rows(query, params):
+        logs = [_format_activity(row) for row in rows]
+        if export_format == "ndjson":
+            yield "".join(json.dumps(log) + "\n" for log in logs)
+        else:
+            buffer = io.StringIO()
+            csv.DictWriter(buffer, fieldnames=ACTIVITY_EXPORT_FIELDS).writerows(logs)
+            yield buffer.getvalue()
+
+
 @router.get("/allactivity")
-async def get_all_activity(authorization: str = Header(...)):
+async def get_all_activity(
+    authorization: str = Header(...),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = Query(None),
+    export_format: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$")
+):
     try:
         token = authorization.split(" ")[1]
         decoded_token = verify_token(token)
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT u.email, a.action, a.metadata, a.created_at
-                    FROM user_activity_log a
-                    LEFT JOIN users u ON a.user_id = u.id
-                    ORDER BY a.created_at DESC
-                """)
-                logs = cursor.fetchall()
-
-                enriched_logs = []
-                for log in logs:
-                    actor_email, action, metadata, timestamp = log
-
-                    if action == 'share':
-                        cursor.execute("""
-                            SELECT f.file_name, ru.email AS recipient_email
-                            FROM files f
-                            JOIN shared_files sf ON f.id = sf.file_id
-                            JOIN users ru ON sf.shared_with = ru.id
-                            WHERE f.file_name = %s OR ru.email = %s
-                            LIMIT 1
-                        """, (metadata, metadata))
-                        result = cursor.fetchone()
-                        if result:
-                            file_name, recipient_email = result
-                            metadata_display = f"shared '{file_name}' with {recipient_email}"
-                        else:
-                            metadata_display = f"shared with unknown ({metadata})"
-                    else:
-                        metadata_display = metadata
-
-                    enriched_logs.append({
-                        "email": actor_email,
-                        "action": action,
-                        "metadata": metadata_display,
-                        "timestamp": timestamp.isoformat()
-                    })
+        keyset_filter, params = _keyset_before(cursor, ["a.created_at", "a.id"])
+
+        query = f"""
+            {ACTIVITY_SELECT}
+            WHERE TRUE {keyset_filter}
+            ORDER BY a.created_at DESC, a.id DESC
+        """
+
+        if export_format != "json":
+            # exports stream every row from the cursor onwards with constant memory
+            if export_format == "ndjson":
+                media_type, header = "application/x-ndjson", ""
+            else:
+                media_type, header = "text/csv", ",".join(ACTIVITY_EXPORT_FIELDS) + "\r\n"
+
+            # the first batch is read here so a busy export slot or a failing
+            # query still gets a proper status instead of a truncated 200
+            chunks = _export_activity(query, params, export_format)
+            try:
+                first = await anext(chunks, "")
+            except PoolError:
+                raise HTTPException(status_code=503, detail="Too many exports in progress, try again later")
+
+            async def body():
+                try:
+                    if header:
+                        yield header
+                    yield first
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+
+            return StreamingResponse(
+                body(),
+                media_type=media_type,
+                headers={"Content-Disposition": f"attachment; filename=activity.{export_format}"}
+            )
+
+        def fetch_activity(conn):
+            with conn.cursor() as cur:
+                cur.execute(query + " LIMIT %s", params + [limit + 1])
+                return cur.fetchall()
+
+        rows = await run_db(fetch_activity)
+        rows, next_cursor = _split_page(rows, limit, lambda r: (r[3].isoformat(), r[6]))
 
         return {
             "message": "All activity logs",
-            "logs": enriched_logs
+            "logs": [_format_activity(row) for row in rows],
+            "next_cursor": next_cursor
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/activity-log")
 async def get_activity_log(
     authorization: str = Header(...),
-    page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True)
 ):
     try:
         token = authorization.split(" ")[1]
@@ -167,64 +315,87 @@ async def get_activity_log(
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        offset = (page - 1) * limit
+        keyset_filter, keyset_params = _keyset_before(cursor, ["a.created_at", "a.id"])
 
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                # Get total count for pagination
-                cursor.execute("SELECT COUNT(*) FROM user_activity_log")
-                total_logs = cursor.fetchone()[0]
+        def fetch_activity_page(conn):
+            with conn.cursor() as cur:
+                total_logs = _estimated_count(cur, "user_activity_log") if include_total else None
 
-                cursor.execute("""
-                    SELECT u.email, a.action, a.metadata, a.created_at
-                    FROM user_activity_log a
-                    LEFT JOIN users u ON a.user_id = u.id
-                    ORDER BY a.created_at DESC
-                    LIMIT %s OFFSET %s
-                """, (limit, offset))
-                logs = cursor.fetchall()
-
-                enriched_logs = []
-                for log in logs:
-                    actor_email, action, metadata, timestamp = log
-
-                    if action == 'share':
-                        cursor.execute("""
-                            SELECT f.file_name, ru.email AS recipient_email
-                            FROM files f
-                            JOIN shared_files sf ON f.id = sf.file_id
-                            JOIN users ru ON sf.shared_with = ru.id
-                            WHERE f.file_name = %s OR ru.email = %s
-                            LIMIT 1
-                        """, (metadata, metadata))
-                        result = cursor.fetchone()
-                        if result:
-                            file_name, recipient_email = result
-                            metadata_display = f"shared '{file_name}' with {recipient_email}"
-                        else:
-                            metadata_display = f"shared with unknown ({metadata})"
-                    else:
-                        metadata_display = metadata
-
-                    enriched_logs.append({
-                        "email": actor_email,
-                        "action": action,
-                        "metadata": metadata_display,
-                        "timestamp": timestamp.isoformat()
-                    })
+                cur.execute(f"""
+                    {ACTIVITY_SELECT}
+                    WHERE TRUE {keyset_filter}
+                    ORDER BY a.created_at DESC, a.id DESC
+                    LIMIT %s
+                """, keyset_params + [limit + 1])
+                return total_logs, cur.fetchall()
+
+        total_logs, rows = await run_db(fetch_activity_page)
+        rows, next_cursor = _split_page(rows, limit, lambda r: (r[3].isoformat(), r[6]))
 
         return {
             "message": "Recent activity log",
-            "page": page,
             "limit": limit,
             "total": total_logs,
-            "logs": enriched_logs
+            "next_cursor": next_cursor,
+            "logs": [_format_activity(row) for row in rows]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# One pass over the filtered log: upload/share volumes are plain aggregates and
+# a failed-login burst is any attempt whose second predecessor (LAG 2) is at
+# most a minute older, i.e. three failures within one minute. The page is cut
+# in SQL; the outer LEFT JOIN keeps the total even when the page is empty.
+SUSPICIOUS_ACTIVITY_SQL = """
+    WITH filtered AS (
+        SELECT a.user_id, a.action, a.metadata, a.created_at
+        FROM user_activity_log a
+        WHERE a.action IN ('upload', 'share', 'failed_login')
+          AND a.user_id IS NOT NULL {date_filter}
+    ),
+    failed AS (
+        SELECT user_id, created_at,
+               created_at - LAG(created_at, 2) OVER (PARTITION BY user_id ORDER BY created_at) AS span
+        FROM filtered
+        WHERE action = 'failed_login'
+    ),
+    summary AS (
+        SELECT user_id, 1 AS ord, 'upload' AS action, COUNT(*) AS count,
+               MIN(created_at) AS first_seen, MAX(created_at) AS last_seen
+        FROM filtered
+        WHERE action = 'upload'
+        GROUP BY user_id
+        HAVING COUNT(*) > 100
+        UNION ALL
+        SELECT user_id, 2, 'share', COUNT(DISTINCT metadata), MIN(created_at), MAX(created_at)
+        FROM filtered
+        WHERE action = 'share'
+        GROUP BY user_id
+        HAVING COUNT(DISTINCT metadata) > 50
+        UNION ALL
+        SELECT user_id, 3, 'failed_login', COUNT(*), MIN(created_at), MAX(created_at)
+        FROM failed
+        GROUP BY user_id
+        HAVING bool_or(span <= INTERVAL '1 minute')
+    ),
+    page AS (
+        SELECT u.email, s.ord, s.action, s.count, s.first_seen, s.last_seen, u.is_locked
+        FROM summary s
+        JOIN users u ON u.id = s.user_id
+        ORDER BY s.ord, u.email
+        LIMIT %s OFFSET %s
+    )
+    SELECT t.total, p.email, p.action, p.count, p.first_seen, p.last_seen, p.is_locked
+    FROM (SELECT COUNT(*) AS total FROM summary) t
+    LEFT JOIN page p ON TRUE
+    ORDER BY p.ord, p.email
+"""
+
+
 @router.get("/suspicious-activity")
 async def get_suspicious_activity(
     authorization: str = Header(...),
@@ -239,9 +410,6 @@ async def get_suspicious_activity(
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        blocked_users = []
-        suspicious_summary = []
-
         date_filter = ""
         params = []
 
@@ -261,92 +429,37 @@ async def get_suspicious_activity(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid end_date format. Use YYYY-MM-DD.")
 
-        with get_db() as conn:
+        def detect_suspicious(conn):
             with conn.cursor() as cursor:
-                cursor.execute("SELECT id, email FROM users WHERE is_locked = TRUE")
-                locked_result = cursor.fetchall()
-                locked_users = {row[0]: row[1] for row in locked_result}
-                blocked_users = list(locked_users.values())
+                cursor.execute("SELECT email FROM users WHERE is_locked = TRUE")
+                blocked_users = [row[0] for row in cursor.fetchall()]
 
-                cursor.execute(f"""
-                    SELECT u.id, u.email, COUNT(*) AS count, MIN(a.created_at), MAX(a.created_at)
-                    FROM user_activity_log a
-                    JOIN users u ON u.id = a.user_id
-                    WHERE a.action = 'upload' {date_filter}
-                    GROUP BY u.id, u.email
-                    HAVING COUNT(*) > 100
-                """, params)
-                for user_id, email, count, first_seen, last_seen in cursor.fetchall():
-                    suspicious_summary.append({
-                        "email": email,
-                        "action": "upload",
-                        "count": count,
-                        "first_seen": first_seen.isoformat(),
-                        "last_seen": last_seen.isoformat(),
-                        "is_locked": user_id in locked_users
-                    })
-
-                cursor.execute(f"""
-                    SELECT u.id, u.email, COUNT(DISTINCT a.metadata) AS count, MIN(a.created_at), MAX(a.created_at)
-                    FROM user_activity_log a
-                    JOIN users u ON u.id = a.user_id
-                    WHERE a.action = 'share' {date_filter}
-                    GROUP BY u.id, u.email
-                    HAVING COUNT(DISTINCT a.metadata) > 50
-                """, params)
-                for user_id, email, count, first_seen, last_seen in cursor.fetchall():
-                    suspicious_summary.append({
-                        "email": email,
-                        "action": "share",
-                        "count": count,
-                        "first_seen": first_seen.isoformat(),
-                        "last_seen": last_seen.isoformat(),
-                        "is_locked": user_id in locked_users
-                    })
-
-                cursor.execute(f"""
-                    SELECT DISTINCT u.id, u.email
-                    FROM user_activity_log a1
-                    JOIN user_activity_log a2 ON a1.user_id = a2.user_id
-                    JOIN user_activity_log a3 ON a1.user_id = a3.user_id
-                    JOIN users u ON u.id = a1.user_id
-                    WHERE a1.action = 'failed_login'
-                      AND a2.action = 'failed_login'
-                      AND a3.action = 'failed_login'
-                      AND a1.created_at < a2.created_at
-                      AND a2.created_at < a3.created_at
-                      AND a3.created_at <= a1.created_at + INTERVAL '1 minute'
-                      {date_filter.replace('a.', 'a1.')}
-                """, params)
-                failed_logins = cursor.fetchall()
-
-                for user_id, email in failed_logins:
-                    cursor.execute(f"""
-                        SELECT COUNT(*), MIN(created_at), MAX(created_at)
-                        FROM user_activity_log
-                        WHERE user_id = %s AND action = 'failed_login' {date_filter.replace('a.', '')}
-                    """, [user_id] + params)
-                    count, first_seen, last_seen = cursor.fetchone()
-                    suspicious_summary.append({
-                        "email": email,
-                        "action": "failed_login",
-                        "count": count,
-                        "first_seen": first_seen.isoformat() if first_seen else None,
-                        "last_seen": last_seen.isoformat() if last_seen else None,
-                        "is_locked": user_id in locked_users
-                    })
-
-        start = (page - 1) * limit
-        end = start + limit
-        paginated_summary = suspicious_summary[start:end]
+                cursor.execute(
+                    SUSPICIOUS_ACTIVITY_SQL.format(date_filter=date_filter),
+                    params + [limit, (page - 1) * limit]
+                )
+                return blocked_users, cursor.fetchall()
+
+        blocked_users, rows = await run_db(detect_suspicious)
 
         return {
             "blocked_users": blocked_users,
             "message": "Suspicious activity detected.",
-            "total": len(suspicious_summary),
+            "total": rows[0][0] if rows else 0,
             "page": page,
             "limit": limit,
-            "suspicious_summary": paginated_summary
+            "suspicious_summary": [
+                {
+                    "email": email,
+                    "action": action,
+                    "count": count,
+                    "first_seen": first_seen.isoformat() if first_seen else None,
+                    "last_seen": last_seen.isoformat() if last_seen else None,
+                    "is_locked": is_locked
+                }
+                for _, email, action, count, first_seen, last_seen, is_locked in rows
+                if email is not None
+            ]
         }
 
     except Exception as e:
@@ -357,8 +470,9 @@ async def get_suspicious_activity(
 @router.get("/user-activity")
 async def get_user_activity(
     email: str,
-    page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
     authorization: str = Header(...)
 ):
     try:
@@ -367,35 +481,35 @@ async def get_user_activity(
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        offset = (page - 1) * limit
+        keyset_filter, keyset_params = _keyset_before(cursor, ["a.created_at", "a.id"])
 
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                # Get total count
-                cursor.execute("""
+        def fetch_user_activity(conn):
+            with conn.cursor() as cur:
+                total_logs = _cached_count(cur, ("user-activity", email), """
                     SELECT COUNT(*)
                     FROM user_activity_log a
                     JOIN users u ON a.user_id = u.id
                     WHERE u.email = %s
-                """, (email,))
-                total_logs = cursor.fetchone()[0]
+                """, (email,)) if include_total else None
 
-                # Fetch paginated logs
-                cursor.execute("""
-                    SELECT a.action, a.metadata, a.created_at
+                cur.execute(f"""
+                    SELECT a.action, a.metadata, a.created_at, a.id
                     FROM user_activity_log a
                     JOIN users u ON a.user_id = u.id
-                    WHERE u.email = %s
-                    ORDER BY a.created_at DESC
-                    LIMIT %s OFFSET %s
-                """, (email, limit, offset))
-                logs = cursor.fetchall()
+                    WHERE u.email = %s {keyset_filter}
+                    ORDER BY a.created_at DESC, a.id DESC
+                    LIMIT %s
+                """, [email] + keyset_params + [limit + 1])
+                return total_logs, cur.fetchall()
+
+        total_logs, logs = await run_db(fetch_user_activity)
+        logs, next_cursor = _split_page(logs, limit, lambda r: (r[2].isoformat(), r[3]))
 
         return {
             "email": email,
-            "page": page,
             "limit": limit,
             "total": total_logs,
+            "next_cursor": next_cursor,
             "logs": [
                 {
                     "action": row[0],
@@ -405,6 +519,8 @@ async def get_user_activity(
             ]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -412,8 +528,9 @@ async def get_user_activity(
 @router.get("/search-users")
 async def search_users(
     query: str = Query(...),
-    page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
     authorization: str = Header(...)
 ):
     try:
@@ -422,31 +539,19 @@ async def search_users(
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        offset = (page - 1) * limit
-
-        with get_db() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM users
-                    WHERE role = 'user' AND email ILIKE %s
-                """, (f"%{query}%",))
-                total_users = cursor.fetchone()[0]
-
-                cursor.execute("""
-                    SELECT id, email FROM users
-                    WHERE role = 'user' AND email ILIKE %s
-                    ORDER BY email
-                    LIMIT %s OFFSET %s
-                """, (f"%{query}%", limit, offset))
-                results = cursor.fetchall()
+        after = decode_cursor(cursor, 4) if cursor else None
+        total_users, results = await run_db(user_search.search_users, query, limit + 1, after)
+        results, next_cursor = _split_page(results, limit, lambda r: (r[2], r[3], r[1], r[0]))
 
         return {
-            "page": page,
             "limit": limit,
-            "total": total_users,
+            "total": total_users if include_total else None,
+            "next_cursor": next_cursor,
             "users": [{"id": r[0], "email": r[1]} for r in results]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -473,8 +578,9 @@ async def filter_activity(
         if date:
             try:
                 date_obj = datetime.strptime(date, "%Y-%m-%d")
-                filters.append("DATE(a.created_at) = %s")
-                values.append(date_obj.date())
+                # a range instead of DATE(created_at) so the created_at indexes apply
+                filters.append("a.created_at >= %s AND a.created_at < %s")
+                values += [date_obj, date_obj + timedelta(days=1)]
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
@@ -489,10 +595,12 @@ async def filter_activity(
 
         query += " ORDER BY a.created_at DESC"
 
-        with get_db() as conn:
+        def fetch_filtered(conn):
             with conn.cursor() as cursor:
                 cursor.execute(query, tuple(values))
-                logs = cursor.fetchall()
+                return cursor.fetchall()
+
+        logs = await run_db(fetch_filtered)
 
         return {
             "logs": [
@@ -516,10 +624,15 @@ async def lock_user(email: str = Query(...), authorization: str = Header(...)):
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        with get_db() as conn:
+        def set_locked(conn):
             with conn.cursor() as cursor:
-                cursor.execute("UPDATE users SET is_locked = TRUE WHERE email = %s", (email,))
+                cursor.execute("UPDATE users SET is_locked = TRUE WHERE email = %s RETURNING id", (email,))
+                locked_ids = [r[0] for r in cursor.fetchall()]
                 conn.commit()
+                return locked_ids
+
+        for user_id in await run_db(set_locked):
+            invalidate_private_key(user_id)
 
         return {"message": f"User '{email}' has been locked"}
 
@@ -534,10 +647,16 @@ async def unlock_user(email: str = Query(...), authorization: str = Header(...))
         if not decoded_token or decoded_token.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admins only")
 
-        with get_db() as conn:
+        def set_locked(conn):
             with conn.cursor() as cursor:
-                cursor.execute("UPDATE users SET is_locked = FALSE WHERE email = %s", (email,))
+                cursor.execute("UPDATE users SET is_locked = FALSE WHERE email = %s RETURNING id", (email,))
+                rows = cursor.fetchall()
                 conn.commit()
+                return [r[0] for r in rows]
+
+        # start the unlocked user with empty windows so one more hit does not relock them
+        for user_id in await run_db(set_locked):
+            await asyncio.to_thread(rate_limiter.reset, user_id)
 
         return {"message": f"User '{email}' has been unlocked"}
 
@@ -545,3 +664,15 @@ async def unlock_user(email: str = Query(...), authorization: str = Header(...))
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/key-cache-stats")
+async def get_key_cache_stats(authorization: str = Header(...)):
+    try:
+        token = authorization.split(" ")[1]
+        decoded_token = verify_token(token)
+        if not decoded_token or decoded_token.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Admins only")
+
+        return private_key_cache.stats()
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
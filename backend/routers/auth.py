@@ -1,52 +1,56 @@
 from fastapi import APIRouter, HTTPException, Header
 from schemas.auth import RegisterRequest, LoginRequest
-from db import get_db  
+from db import get_db, run_db
+from keygen import new_rsa_keypair
+from user_keys import invalidate_private_key
+from ratelimit import rate_limiter, FAILED_LOGIN_LIMIT
+from audit_log import log_activity
+from keystore import key_store
+from user_search import user_search_index
 from utils.jwt_handler import create_access_token, verify_token
-from utils.rsa import generate_rsa_keys
 from utils.aes import encrypt_private_key, generate_aes_key
 import bcrypt
-from dotenv import load_dotenv, set_key
-import os
+import asyncio
 
 router = APIRouter()
 
-env_file = ".env"
-load_dotenv(dotenv_path=env_file)
-
 @router.post("/register")
-def register(data: RegisterRequest):
+async def register(data: RegisterRequest):
     try:
-        with get_db() as conn:
+        def email_taken(conn):
             with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM users WHERE email = %s", (data.email,))
-                existing_user = cursor.fetchone()
-                if existing_user:
-                    raise HTTPException(status_code=409, detail="Email already registered")
+                cursor.execute("SELECT 1 FROM users WHERE email = %s", (data.email,))
+                return cursor.fetchone() is not None
 
-                hashed_pw = bcrypt.hashpw(data.password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        if await run_db(email_taken):
+            raise HTTPException(status_code=409, detail="Email already registered")
 
-                public_key, private_key = generate_rsa_keys(bits=2048)
-                aes_key = generate_aes_key()
-                encrypted_private_key = encrypt_private_key(private_key, aes_key)
+        hashed_pw = (await asyncio.to_thread(
+            bcrypt.hashpw, data.password.encode("utf-8"), bcrypt.gensalt()
+        )).decode("utf-8")
 
-                user_key_prefix = f"USER_{data.email.upper().replace('@', '_').replace('.', '_')}"
-                set_key(env_file, f"{user_key_prefix}_ENCRYPTED_PRIVATE_KEY", encrypted_private_key)
-                set_key(env_file, f"{user_key_prefix}_AES_KEY", aes_key.hex())
+        public_key, private_key = await new_rsa_keypair()
+        aes_key = generate_aes_key()
+        encrypted_private_key = encrypt_private_key(private_key, aes_key)
 
+        def insert_user(conn):
+            with conn.cursor() as cursor:
                 cursor.execute(
-                    "INSERT INTO users (email, password, rsa_public_key) VALUES (%s, %s, %s)",
+                    "INSERT INTO users (email, password, rsa_public_key) VALUES (%s, %s, %s) RETURNING id",
                     (data.email, hashed_pw, public_key)
                 )
+                user_id = cursor.fetchone()[0]
+                key_store.save_keys(user_id, data.email, encrypted_private_key, aes_key.hex(), conn=conn)
                 conn.commit()
+                return user_id
 
-        return {
-            "message": "User registered successfully",
-            "env_keys": {
-                f"{user_key_prefix}_ENCRYPTED_PRIVATE_KEY": encrypted_private_key,
-                f"{user_key_prefix}_AES_KEY": aes_key.hex()
-            }
-        }
+        user_id = await run_db(insert_user)
+        user_search_index.add(user_id, data.email)
+
+        return {"message": "User registered successfully"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -63,11 +67,7 @@ def login(data: LoginRequest):
                 user = cursor.fetchone()
 
                 if user is None:
-                    cursor.execute(
-                        "INSERT INTO user_activity_log (user_id, action, metadata) VALUES (%s, %s, %s)",
-                        (None, 'failed_login', data.email)
-                    )
-                    conn.commit()
+                    log_activity(None, 'failed_login', data.email, conn=conn)
                     raise HTTPException(status_code=401, detail="Invalid credentials")
 
                 db_id, db_email, db_hashed_password, db_role, is_locked = user
@@ -81,30 +81,18 @@ def login(data: LoginRequest):
                     raise HTTPException(status_code=401, detail="Invalid credentials")
 
                 if not password_matches:
-                    cursor.execute(
-                        "INSERT INTO user_activity_log (user_id, action, metadata) VALUES (%s, %s, %s)",
-                        (db_id, 'failed_login', data.email)
-                    )
-
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM user_activity_log
-                        WHERE user_id = %s 
-                          AND action = 'failed_login'
-                          AND created_at >= NOW() - INTERVAL '1 minute'
-                    """, (db_id,))
-                    failed_count = cursor.fetchone()[0]
-
-                    if failed_count >= 3:
+                    failed_count = rate_limiter.hit("failed_login", db_id, conn=conn)
+
+                    if failed_count >= FAILED_LOGIN_LIMIT:
                         cursor.execute("UPDATE users SET is_locked = TRUE WHERE id = %s", (db_id,))
 
                     conn.commit()
+                    log_activity(db_id, 'failed_login', data.email, conn=conn)
+                    if failed_count >= FAILED_LOGIN_LIMIT:
+                        invalidate_private_key(db_id)
                     raise HTTPException(status_code=401, detail="Invalid credentials")
 
-                cursor.execute(
-                    "INSERT INTO user_activity_log (user_id, action, metadata) VALUES (%s, %s, %s)",
-                    (db_id, 'login', data.email)
-                )
-                conn.commit()
+        log_activity(db_id, 'login', data.email)
         token = create_access_token({
             "user_id": db_id,
             "role": db_role
@@ -1,21 +1,25 @@
 from fastapi import APIRouter, UploadFile, HTTPException, Header, Query
+from typing import Optional
+from datetime import datetime
 import os
 import base64
 import asyncio
-from dotenv import load_dotenv
-import httpx
-from Cryptodome.Cipher import AES
 from Cryptodome.Random import get_random_bytes
 
-from supabase_client import supabase
-from utils.aes import decrypt_private_key
-from utils.rsa import encrypt_rsa, decrypt_rsa
+from supabase_client import supabase, upload_stream, remove_objects
+from blob_cache import blob_cache, fetch_blob
+from user_keys import get_private_key, invalidate_private_key
+from ratelimit import rate_limiter, UPLOAD_LIMIT
+from audit_log import log_activity
+from utils.file_crypto import encrypt_upload, decrypt_blob, PlaintextDigest
+from utils.rsa import encrypt_rsa, decrypt_rsa, unwrap_aes_keys
 from utils.jwt_handler import verify_token
-from db import get_db
-import concurrent.futures
+from utils.download import stream_decrypted_file
+from utils.pagination import encode_cursor, decode_cursor
+from db import run_db
+from executors import run_cpu, run_cpu_batched
 
 router = APIRouter()
-load_dotenv()
 
 def generate_unique_filename(base_name: str, user_id: str, existing_names: set) -> str:
     if base_name not in existing_names:
@@ -36,7 +40,7 @@ async def upload_file(file: UploadFile, authorization: str = Header(...)):
             raise HTTPException(status_code=403, detail="Only users with role 'user' can access this endpoint")
         user_id = decoded_token["user_id"]
 
-        with get_db() as conn:
+        def load_upload_context(conn):
             with conn.cursor() as cursor:
                 cursor.execute("SELECT is_locked, rsa_public_key FROM users WHERE id = %s", (user_id,))
                 row = cursor.fetchone()
@@ -48,83 +52,96 @@ async def upload_file(file: UploadFile, authorization: str = Header(...)):
                     raise HTTPException(status_code=403, detail="Your account is locked due to suspicious activity")
 
                 cursor.execute("SELECT file_name FROM files WHERE owner_id = %s", (user_id,))
-                existing_names = {r[0] for r in cursor.fetchall()}
+                return public_key, {r[0] for r in cursor.fetchall()}
+
+        public_key, existing_names = await run_db(load_upload_context)
 
         file_name = generate_unique_filename(file.filename, user_id, existing_names)
         file_path = f"user_{user_id}/{file_name}"
 
-        file_content = await file.read()
         aes_key = get_random_bytes(32)
-        cipher = AES.new(aes_key, AES.MODE_EAX)
-        nonce = cipher.nonce
-        ciphertext, tag = cipher.encrypt_and_digest(file_content)
-        full_data = nonce + tag + ciphertext
-
-        encrypted_aes_key = await asyncio.to_thread(encrypt_rsa, public_key, aes_key.hex())
+        encrypted_aes_key = await run_cpu(encrypt_rsa, public_key, aes_key.hex())
 
         bucket = "file"
-        await asyncio.to_thread(supabase.storage.from_(bucket).upload, file_path, full_data)
+        digest = PlaintextDigest()
+        await upload_stream(bucket, file_path, encrypt_upload(file, aes_key, digest=digest))
         file_url = supabase.storage.from_(bucket).get_public_url(file_path)
+        content_sha256 = digest.hexdigest()
 
-        await asyncio.to_thread(
-            lambda: supabase.table("files").insert({
-                "owner_id": user_id,
-                "file_name": file_name,
-                "file_type": file.content_type,
-                "file_url": file_url,
-                "encrypted_aes_key": str(encrypted_aes_key)
-            }).execute()
-        )
-
-        with get_db() as conn:
+        def record_upload(conn):
             with conn.cursor() as cursor:
-                cursor.execute(
-                    "INSERT INTO user_activity_log (user_id, action, metadata) VALUES (%s, %s, %s)",
-                    (user_id, 'upload', file_name)
-                )
-
                 cursor.execute("""
-                    SELECT COUNT(*) FROM user_activity_log
-                    WHERE user_id = %s AND action = 'upload' AND created_at > NOW() - INTERVAL '1 minute'
-                """, (user_id,))
-                upload_count = cursor.fetchone()[0]
+                    INSERT INTO files (owner_id, file_name, file_type, file_url, encrypted_aes_key, file_size, content_sha256)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (user_id, file_name, file.content_type, file_url, str(encrypted_aes_key), digest.size, content_sha256))
+
+                upload_count = rate_limiter.hit("upload", user_id, conn=conn)
 
-                if upload_count > 100:
+                if upload_count > UPLOAD_LIMIT:
                     cursor.execute("UPDATE users SET is_locked = TRUE WHERE id = %s", (user_id,))
                     conn.commit()
+                    log_activity(user_id, 'upload', file_name, conn=conn)
+                    invalidate_private_key(user_id)
                     raise HTTPException(
                         status_code=403,
                         detail="Your account is locked due to excessive uploads (more than 100 in 1 minute)."
                     )
 
                 conn.commit()
+                log_activity(user_id, 'upload', file_name, conn=conn)
 
-        cipher = AES.new(aes_key, AES.MODE_EAX, nonce=nonce)
-        decrypted = cipher.decrypt_and_verify(ciphertext, tag)
-
-        decoded_content = (
-            decrypted.decode("utf-8", errors="ignore")
-            if file.content_type.startswith("text/")
-            else base64.b64encode(decrypted).decode("utf-8")
-        )
+        await run_db(record_upload)
 
         return {
             "file": {
                 "file_name": file_name,
                 "file_type": file.content_type,
-                "decrypted_content": decoded_content
+                "file_size": digest.size,
+                "content_sha256": content_sha256,
+                "storage_path": file_path
             }
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
-process_pool = concurrent.futures.ProcessPoolExecutor()
+MY_FILES_SORT_COLUMNS = {
+    "uploaded_at": "f.created_at",
+    "file_name": "f.file_name",
+    "file_size": "COALESCE(f.file_size, 0)",
+}
+
+
+def _file_sort_value(record, sort: str):
+    if sort == "uploaded_at":
+        return record[4].isoformat()
+    if sort == "file_name":
+        return record[1]
+    return record[3] or 0
+
+
+def _file_metadata(record) -> dict:
+    return {
+        "file_name": record[1],
+        "file_type": record[2],
+        "file_size": record[3],
+        "uploaded_at": record[4].isoformat() if record[4] else None
+    }
+
 
 @router.get("/my-files")
-async def get_user_files(authorization: str = Header(...)):
+async def get_user_files(
+    authorization: str = Header(...),
+    include_content: bool = Query(False),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("uploaded_at", pattern="^(uploaded_at|file_name|file_size)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$")
+):
     try:
         token = authorization.split(" ")[1]
         decoded_token = verify_token(token)
@@ -132,61 +149,79 @@ async def get_user_files(authorization: str = Header(...)):
             raise HTTPException(status_code=403, detail="Only users with role 'user' can access this endpoint")
         user_id = decoded_token["user_id"]
 
-        def get_user_info_and_records():
-            with get_db() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT is_locked, email FROM users WHERE id = %s", (user_id,))
-                    user_row = cursor.fetchone()
-                    if not user_row:
-                        raise HTTPException(status_code=404, detail="User not found")
-                    is_locked, email = user_row
-                    if is_locked:
-                        raise HTTPException(status_code=403, detail="Your account is locked")
-
-                    cursor.execute("""
-                        SELECT u.email, f.file_name, f.file_type, f.file_url, f.encrypted_aes_key
-                        FROM users u
-                        JOIN files f ON u.id = f.owner_id
-                        WHERE u.id = %s
-                    """, (user_id,))
-                    return email, cursor.fetchall()
-
-        user_email, records = await asyncio.to_thread(get_user_info_and_records)
+        sort_column = MY_FILES_SORT_COLUMNS[sort]
+        keyset_filter = ""
+        params = [user_id]
+        if cursor:
+            cursor_sort, cursor_order, last_value, last_id = decode_cursor(cursor, 4)
+            if cursor_sort != sort or cursor_order != order:
+                raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+            if sort == "uploaded_at":
+                try:
+                    last_value = datetime.fromisoformat(last_value)
+                except (TypeError, ValueError):
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+            keyset_filter = f" AND ({sort_column}, f.id) {'<' if order == 'desc' else '>'} (%s, %s)"
+            params += [last_value, last_id]
+        params.append(limit + 1)
+
+        def get_user_info_and_records(conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT is_locked, email FROM users WHERE id = %s", (user_id,))
+                user_row = cur.fetchone()
+                if not user_row:
+                    raise HTTPException(status_code=404, detail="User not found")
+                is_locked, email = user_row
+                if is_locked:
+                    raise HTTPException(status_code=403, detail="Your account is locked")
+
+                cur.execute(f"""
+                    SELECT f.id, f.file_name, f.file_type, f.file_size, f.created_at,
+                           f.file_url, f.encrypted_aes_key
+                    FROM files f
+                    WHERE f.owner_id = %s{keyset_filter}
+                    ORDER BY {sort_column} {order}, f.id {order}
+                    LIMIT %s
+                """, params)
+                return email, cur.fetchall()
+
+        user_email, records = await run_db(get_user_info_and_records)
+
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            next_cursor = encode_cursor(sort, order, _file_sort_value(last, sort), last[0])
+
         if not records:
-            return {"message": "No files found", "files": []}
+            return {"message": "No files found", "files": [], "next_cursor": None}
+
+        if not include_content:
+            return {
+                "message": "Files retrieved successfully",
+                "files": [_file_metadata(r) for r in records],
+                "next_cursor": next_cursor
+            }
 
-        prefix = f"USER_{user_email.upper().replace('@', '_').replace('.', '_')}"
-        encrypted_private_key = os.getenv(f"{prefix}_ENCRYPTED_PRIVATE_KEY")
-        aes_key_hex = os.getenv(f"{prefix}_AES_KEY")
-        if not encrypted_private_key or not aes_key_hex:
+        private_key = await get_private_key(user_id, user_email)
+        if private_key is None:
             raise HTTPException(status_code=404, detail="Key not found in environment")
 
-        private_key = await asyncio.to_thread(
-            decrypt_private_key,
-            encrypted_private_key,
-            bytes.fromhex(aes_key_hex)
-        )
+        # every wrapped key on the page is unwrapped in a few worker-sized batches
+        aes_keys = await run_cpu_batched(unwrap_aes_keys, private_key, [r[6] for r in records])
 
         semaphore = asyncio.Semaphore(20)
 
-        async def decrypt_file(file_data, client):
-            _, file_name, file_type, file_url, encrypted_aes_key = file_data
+        async def decrypt_file(file_data, aes_key):
+            file_id, file_name, file_type, file_url = file_data[0], file_data[1], file_data[2], file_data[5]
             async with semaphore:
-                decrypted_aes_key_hex = (await asyncio.get_running_loop().run_in_executor(
-                    process_pool, decrypt_rsa, private_key, int(encrypted_aes_key)
-                )).strip()
-                aes_key = bytes.fromhex(decrypted_aes_key_hex)
-
-                response = await client.get(file_url)
-                response.raise_for_status()
-                content = response.content
+                if aes_key is None:
+                    raise Exception(f"File '{file_name}' has an unreadable key.")
 
-                nonce, tag, ciphertext = content[:16], content[16:32], content[32:]
+                content = await fetch_blob(file_url, file_id)
 
                 try:
-                    decrypted = await asyncio.to_thread(
-                        lambda: AES.new(aes_key, AES.MODE_EAX, nonce).decrypt_and_verify(ciphertext, tag)
-                    )
+                    decrypted = await asyncio.to_thread(decrypt_blob, aes_key, content)
                 except Exception:
                     raise Exception(f"File '{file_name}'to have been tampered with or corrupted.")
 
@@ -196,26 +231,25 @@ async def get_user_files(authorization: str = Header(...)):
                     else base64.b64encode(decrypted).decode("utf-8")
                 )
                 return {
-                    "file_name": file_name,
-                    "file_type": file_type,
+                    **_file_metadata(file_data),
                     "decrypted_content": decoded_content
                 }
 
         decrypted_files = []
         corrupted_files = []
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            tasks = [decrypt_file(f, client) for f in records]
-            for task in asyncio.as_completed(tasks):
-                try:
-                    result = await task
-                    decrypted_files.append(result)
-                except Exception as e:
-                    corrupted_files.append(str(e))
+        tasks = [decrypt_file(f, k) for f, k in zip(records, aes_keys)]
+        for task in asyncio.as_completed(tasks):
+            try:
+                result = await task
+                decrypted_files.append(result)
+            except Exception as e:
+                corrupted_files.append(str(e))
 
         response = {
             "message": "Some files failed to decrypt" if corrupted_files else "Files retrieved and decrypted successfully",
-            "files": decrypted_files
+            "files": decrypted_files,
+            "next_cursor": next_cursor
         }
 
         if corrupted_files:
@@ -223,6 +257,56 @@ async def get_user_files(authorization: str = Header(...)):
 
         return response
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/download")
+async def download_file(
+    file_name: str,
+    authorization: str = Header(...),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    try:
+        token = authorization.split(" ")[1]
+        decoded_token = verify_token(token)
+        if not decoded_token or decoded_token.get("role") != "user":
+            raise HTTPException(status_code=403, detail="Only users with role 'user' can access this endpoint")
+        user_id = decoded_token["user_id"]
+
+        def load_file(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT is_locked, email FROM users WHERE id = %s", (user_id,))
+                user_row = cursor.fetchone()
+                if not user_row:
+                    raise HTTPException(status_code=404, detail="User not found")
+                is_locked, email = user_row
+                if is_locked:
+                    raise HTTPException(status_code=403, detail="Your account is locked")
+
+                cursor.execute("""
+                    SELECT file_type, file_url, encrypted_aes_key
+                    FROM files
+                    WHERE file_name = %s AND owner_id = %s
+                """, (file_name, user_id))
+                file_row = cursor.fetchone()
+                if not file_row:
+                    raise HTTPException(status_code=404, detail="File not found")
+                return email, file_row
+
+        user_email, (file_type, file_url, encrypted_aes_key) = await run_db(load_file)
+
+        private_key = await get_private_key(user_id, user_email)
+        if private_key is None:
+            raise HTTPException(status_code=404, detail="Key not found in environment")
+        file_key_hex = (await run_cpu(decrypt_rsa, private_key, int(encrypted_aes_key))).strip()
+
+        return await stream_decrypted_file(file_url, bytes.fromhex(file_key_hex), file_name, file_type, range_header)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -343,27 +427,28 @@ async def delete_file(file_name: str, authorization: str = Header(...)):
 
         user_id = decoded_token["user_id"]
 
-        with get_db() as conn:
+        def remove_file(conn):
             with conn.cursor() as cursor:
                 cursor.execute("SELECT is_locked FROM users WHERE id = %s", (user_id,))
                 if cursor.fetchone()[0]:
                     raise HTTPException(status_code=403, detail="Your account is locked")
 
                 cursor.execute("""
-                    SELECT file_url FROM files WHERE file_name = %s AND owner_id = %s
+                    DELETE FROM files WHERE file_name = %s AND owner_id = %s RETURNING id, file_url
                 """, (file_name, user_id))
                 row = cursor.fetchone()
                 if not row:
                     raise HTTPException(status_code=404, detail="File not found")
+                conn.commit()
+                return row
 
-                file_url = row[0]
-                path_start = file_url.find("/file/") + len("/file/")
-                file_path = file_url[path_start:]
-
-                supabase.storage.from_("file").remove([file_path])
+        # the blob is removed after the row is committed, so no pooled
+        # connection is held across the storage round trip
+        file_id, file_url = await run_db(remove_file)
+        blob_cache.invalidate(file_url, file_id)
 
-                cursor.execute("DELETE FROM files WHERE file_name = %s AND owner_id = %s", (file_name, user_id))
-                conn.commit()
+        path_start = file_url.find("/file/") + len("/file/")
+        await remove_objects("file", [file_url[path_start:]])
 
         return {"message": f"'{file_name}' deleted successfully"}
 
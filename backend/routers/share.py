@@ -1,18 +1,27 @@
-from fastapi import APIRouter, HTTPException, Header
-from db import get_db
+from fastapi import APIRouter, HTTPException, Header, Query
+from typing import Optional
+from db import run_db
 from utils.jwt_handler import verify_token
-from utils.rsa import encrypt_rsa, decrypt_rsa
-from utils.aes import decrypt_private_key
-from schemas.share import ShareFileRequest
-from Cryptodome.Cipher import AES
-import requests
+from utils.rsa import decrypt_rsa, rewrap_aes_key, unwrap_aes_keys, wrap_aes_keys
+from user_keys import get_private_key, invalidate_private_key
+from ratelimit import rate_limiter, SHARE_LIMIT
+from audit_log import log_activity
+from schemas.share import ShareFileRequest, BulkShareRequest
+from utils.file_crypto import decrypt_blob
+from utils.download import stream_decrypted_file
+from blob_cache import fetch_blob
+from executors import run_cpu, run_cpu_batched
+from psycopg2.extras import execute_values
 import base64
-import httpx
-import asyncio
 import os
+import asyncio
 
 router = APIRouter()
 
+# file x recipient pairs accepted by one /share-files call
+BULK_SHARE_MAX_PAIRS = int(os.getenv("BULK_SHARE_MAX_PAIRS", "500"))
+
+
 @router.post("/share-file")
 async def share_file(payload: ShareFileRequest, authorization: str = Header(...)):
     try:
@@ -25,7 +34,7 @@ async def share_file(payload: ShareFileRequest, authorization: str = Header(...)
         file_name = payload.file_name
         shared_with_email = payload.shared_with_email
 
-        with get_db() as conn:
+        def load_share_context(conn):
             with conn.cursor() as cur:
                 cur.execute("SELECT is_locked, email FROM users WHERE id = %s", (owner_id,))
                 row = cur.fetchone()
@@ -53,19 +62,19 @@ async def share_file(payload: ShareFileRequest, authorization: str = Header(...)
                 if recipient_role == "admin":
                     raise HTTPException(status_code=403, detail="You cannot share files with an admin account")
 
-        env_key_prefix = f"USER_{owner_email.upper().replace('@', '_').replace('.', '_')}"
-        encrypted_private_key = os.getenv(f"{env_key_prefix}_ENCRYPTED_PRIVATE_KEY")
-        aes_key_hex = os.getenv(f"{env_key_prefix}_AES_KEY")
-        if not encrypted_private_key or not aes_key_hex:
-            raise HTTPException(status_code=404, detail="Owner key not found in env")
+                return owner_email, file_id, encrypted_aes_key, recipient_id, recipient_public_key
+
+        owner_email, file_id, encrypted_aes_key, recipient_id, recipient_public_key = await run_db(load_share_context)
 
-        owner_aes_key = bytes.fromhex(aes_key_hex)
-        owner_private_key = decrypt_private_key(encrypted_private_key, owner_aes_key)
+        owner_private_key = await get_private_key(owner_id, owner_email)
+        if owner_private_key is None:
+            raise HTTPException(status_code=404, detail="Owner key not found in env")
 
-        original_aes_key_hex = decrypt_rsa(owner_private_key, int(encrypted_aes_key))
-        encrypted_aes_key_for_recipient = encrypt_rsa(recipient_public_key, original_aes_key_hex)
+        encrypted_aes_key_for_recipient = await run_cpu(
+            rewrap_aes_key, owner_private_key, encrypted_aes_key, recipient_public_key
+        )
 
-        with get_db() as conn:
+        def record_share(conn):
             with conn.cursor() as cur:
                 cur.execute(
                     """
@@ -75,36 +84,193 @@ async def share_file(payload: ShareFileRequest, authorization: str = Header(...)
                     (file_id, recipient_id, encrypted_aes_key_for_recipient),
                 )
 
-                cur.execute(
-                    "INSERT INTO user_activity_log (user_id, action, metadata) VALUES (%s, %s, %s)",
-                    (owner_id, 'share', shared_with_email)
-                )
-
-                cur.execute("""
-                    SELECT COUNT(DISTINCT metadata)
-                    FROM user_activity_log
-                    WHERE user_id = %s AND action = 'share' AND created_at > NOW() - INTERVAL '1 minute'
-                """, (owner_id,))
-                unique_shares = cur.fetchone()[0]
-                print(f"Unique shares in the last minute: {unique_shares}")
+                unique_shares = rate_limiter.hit("share", owner_id, member=shared_with_email, conn=conn)
 
-                if unique_shares > 50:
+                if unique_shares > SHARE_LIMIT:
                     cur.execute("UPDATE users SET is_locked = TRUE WHERE id = %s", (owner_id,))
                     conn.commit()
+                    log_activity(owner_id, 'share', shared_with_email, file_id, recipient_id, conn=conn)
+                    invalidate_private_key(owner_id)
                     raise HTTPException(
                         status_code=403,
                         detail="Your account is locked due to excessive sharing (more than 50 unique shares in 1 minute)."
                     )
                 conn.commit()
+                log_activity(owner_id, 'share', shared_with_email, file_id, recipient_id, conn=conn)
+
+        await run_db(record_share)
 
         return {"message": "File shared successfully"}
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/share-files")
+async def share_files(payload: BulkShareRequest, authorization: str = Header(...)):
+    try:
+        token = authorization.split(" ")[1]
+        decoded_token = verify_token(token)
+        if not decoded_token or decoded_token.get("role") != "user":
+            raise HTTPException(status_code=403, detail="Only users with role 'user' can access this endpoint")
+
+        owner_id = decoded_token["user_id"]
+        file_names = list(dict.fromkeys(payload.file_names))
+        recipient_emails = list(dict.fromkeys(payload.shared_with_emails))
+        if len(file_names) * len(recipient_emails) > BULK_SHARE_MAX_PAIRS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_SHARE_MAX_PAIRS} file/recipient pairs per request")
+
+        def load_bulk_context(conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT is_locked, email FROM users WHERE id = %s", (owner_id,))
+                row = cur.fetchone()
+                if not row:
+                    raise HTTPException(status_code=404, detail="User not found")
+                is_locked, owner_email = row
+                if is_locked:
+                    raise HTTPException(status_code=403, detail="Your account is locked")
+
+                cur.execute(
+                    "SELECT file_name, id, encrypted_aes_key FROM files WHERE owner_id = %s AND file_name = ANY(%s)",
+                    (owner_id, file_names),
+                )
+                files = {r[0]: r[1:] for r in cur.fetchall()}
+
+                cur.execute(
+                    "SELECT email, id, rsa_public_key, role FROM users WHERE email = ANY(%s)",
+                    (recipient_emails,),
+                )
+                recipients = {r[0]: r[1:] for r in cur.fetchall()}
+
+                existing = set()
+                if files and recipients:
+                    cur.execute(
+                        "SELECT file_id, shared_with FROM shared_files WHERE file_id = ANY(%s) AND shared_with = ANY(%s)",
+                        ([r[0] for r in files.values()], [r[0] for r in recipients.values()]),
+                    )
+                    existing = set(cur.fetchall())
+                recent = rate_limiter.active_members("share", owner_id, conn=conn)
+                return owner_email, files, recipients, existing, recent
+
+        owner_email, files, recipients, existing, recent = await run_db(load_bulk_context)
+
+        failed = []
+        for email in recipient_emails:
+            if email not in recipients:
+                failed += [(f, email, "Recipient user not found") for f in file_names]
+            elif recipients[email][2] == "admin":
+                failed += [(f, email, "You cannot share files with an admin account") for f in file_names]
+        valid_recipients = [e for e in recipient_emails if e in recipients and recipients[e][2] != "admin"]
+
+        for name in file_names:
+            if name not in files:
+                failed += [(name, e, "File not found or no permission") for e in valid_recipients]
+        valid_files = [f for f in file_names if f in files]
+
+        def is_shared(name, email):
+            return (files[name][0], recipients[email][0]) in existing
+
+        for name in valid_files:
+            failed += [(name, e, "File is already shared with this user") for e in valid_recipients if is_shared(name, e)]
+
+        # the same budget as /share-file: SHARE_LIMIT distinct recipients per
+        # window, checked before anything is written; recipients already in
+        # the window do not use it up
+        over_budget = False
+        budget = SHARE_LIMIT - len(recent)
+        allowed_recipients = []
+        for email in valid_recipients:
+            if all(is_shared(f, email) for f in valid_files):
+                continue
+            if email not in recent:
+                if budget <= 0:
+                    over_budget = True
+                    failed += [(f, email, "Share limit reached") for f in valid_files if not is_shared(f, email)]
+                    continue
+                budget -= 1
+            allowed_recipients.append(email)
+        valid_recipients = allowed_recipients
+
+        pairs, wrapped = [], []
+        if valid_files and valid_recipients:
+            owner_private_key = await get_private_key(owner_id, owner_email)
+            if owner_private_key is None:
+                raise HTTPException(status_code=404, detail="Owner key not found in env")
+
+            # each file key is unwrapped once, then wrapped for every recipient
+            aes_keys = await run_cpu_batched(unwrap_aes_keys, owner_private_key, [files[f][1] for f in valid_files])
+            aes_keys_hex = {}
+            for name, aes_key in zip(valid_files, aes_keys):
+                if aes_key is None:
+                    failed += [(name, e, "File key could not be decrypted") for e in valid_recipients if not is_shared(name, e)]
+                else:
+                    aes_keys_hex[name] = aes_key.hex()
+
+            pairs = [(f, e) for f in valid_files if f in aes_keys_hex for e in valid_recipients if not is_shared(f, e)]
+            wrapped = await run_cpu_batched(
+                wrap_aes_keys, aes_keys_hex, [(f, recipients[e][1]) for f, e in pairs]
+            )
+
+        def record_shares(conn):
+            with conn.cursor() as cur:
+                # pairs shared by a concurrent request since the check above are skipped
+                inserted = set(execute_values(
+                    cur,
+                    """
+                    INSERT INTO shared_files (file_id, shared_with, encrypted_aes_key)
+                    SELECT v.file_id, v.shared_with, v.encrypted_aes_key
+                    FROM (VALUES %s) AS v (file_id, shared_with, encrypted_aes_key)
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM shared_files s
+                        WHERE s.file_id = v.file_id AND s.shared_with = v.shared_with
+                    )
+                    ON CONFLICT DO NOTHING
+                    RETURNING file_id, shared_with
+                    """,
+                    [(files[f][0], recipients[e][0], w) for (f, e), w in zip(pairs, wrapped)],
+                    fetch=True,
+                ))
+                done = [(f, e) for f, e in pairs if (files[f][0], recipients[e][0]) in inserted]
+
+                unique_shares = 0
+                for email in dict.fromkeys(e for _, e in done):
+                    unique_shares = rate_limiter.hit("share", owner_id, member=email, conn=conn)
+
+                # going over the budget locks the account, as the 51st single share does
+                locked = over_budget or unique_shares > SHARE_LIMIT
+                if locked:
+                    cur.execute("UPDATE users SET is_locked = TRUE WHERE id = %s", (owner_id,))
+                conn.commit()
+
+                for f, e in done:
+                    log_activity(owner_id, 'share', e, files[f][0], recipients[e][0], conn=conn)
+                if locked:
+                    invalidate_private_key(owner_id)
+                    raise HTTPException(
+                        status_code=403,
+                        detail="Your account is locked due to excessive sharing (more than 50 unique shares in 1 minute)."
+                    )
+                return done
+
+        shared = await run_db(record_shares) if pairs or over_budget else []
+        failed += [(f, e, "File is already shared with this user") for f, e in pairs if (f, e) not in shared]
+
+        return {
+            "message": "Files shared successfully" if not failed else "Some shares failed",
+            "shared": [{"file_name": f, "shared_with_email": e} for f, e in shared],
+            "failed": [{"file_name": f, "shared_with_email": e, "error": err} for f, e, err in failed]
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/shared-files")
-async def get_shared_files(authorization: str = Header(...)):
+async def get_shared_files(authorization: str = Header(...), include_content: bool = Query(False)):
     try:
         token = authorization.split(" ")[1]
         decoded_token = verify_token(token)
@@ -113,7 +279,7 @@ async def get_shared_files(authorization: str = Header(...)):
 
         user_id = decoded_token["user_id"]
 
-        with get_db() as conn:
+        def load_shared_records(conn):
             with conn.cursor() as cursor:
                 cursor.execute("SELECT is_locked, email FROM users WHERE id = %s", (user_id,))
                 row = cursor.fetchone()
@@ -125,48 +291,49 @@ async def get_shared_files(authorization: str = Header(...)):
 
                 cursor.execute("""
                     SELECT u.email, f.file_name, f.file_type, f.file_url,
-                           sf.encrypted_aes_key, o.email AS owner_email
+                           sf.encrypted_aes_key, o.email AS owner_email, f.id
                     FROM shared_files sf
                     JOIN files f ON sf.file_id = f.id
                     JOIN users u ON sf.shared_with = u.id
                     JOIN users o ON f.owner_id = o.id
                     WHERE sf.shared_with = %s
                 """, (user_id,))
-                result = cursor.fetchall()
-
-                if not result:
-                    return {
-                        "message": "No shared files found",
-                        "shared_files": []
-                    }
-
-                shared_files = result
-
-        prefix = f"USER_{user_email.upper().replace('@', '_').replace('.', '_')}"
-        encrypted_private_key = os.getenv(f"{prefix}_ENCRYPTED_PRIVATE_KEY")
-        aes_key_hex = os.getenv(f"{prefix}_AES_KEY")
-        if not encrypted_private_key or not aes_key_hex:
+                return user_email, cursor.fetchall()
+
+        user_email, shared_files = await run_db(load_shared_records)
+
+        if not shared_files:
+            return {
+                "message": "No shared files found",
+                "shared_files": []
+            }
+
+        if not include_content:
+            return {
+                "message": "Shared files retrieved successfully",
+                "shared_files": [
+                    {"file_name": f[1], "file_type": f[2], "owner_email": f[5]}
+                    for f in shared_files
+                ]
+            }
+
+        private_key = await get_private_key(user_id, user_email)
+        if private_key is None:
             raise HTTPException(status_code=404, detail="Missing decryption keys")
 
-        private_key = await asyncio.to_thread(decrypt_private_key, encrypted_private_key, bytes.fromhex(aes_key_hex))
+        aes_keys = await run_cpu_batched(unwrap_aes_keys, private_key, [f[4] for f in shared_files])
 
         semaphore = asyncio.Semaphore(10)
 
-        async def process_shared_file(file, client):
-            file_name, file_type, file_url, encrypted_aes_key, owner_email = file[1:]
+        async def process_shared_file(file, aes_key):
+            file_name, file_type, file_url, _, owner_email, file_id = file[1:]
             async with semaphore:
                 try:
-                    aes_key_hex = (await asyncio.to_thread(decrypt_rsa, private_key, int(encrypted_aes_key))).strip()
-                    aes_key = bytes.fromhex(aes_key_hex)
+                    if aes_key is None:
+                        raise ValueError("unreadable key")
 
-                    response = await client.get(file_url)
-                    response.raise_for_status()
-
-                    content = response.content
-                    nonce, tag, ciphertext = content[:16], content[16:32], content[32:]
-
-                    cipher = AES.new(aes_key, AES.MODE_EAX, nonce=nonce)
-                    decrypted = cipher.decrypt_and_verify(ciphertext, tag)
+                    content = await fetch_blob(file_url, file_id)
+                    decrypted = await asyncio.to_thread(decrypt_blob, aes_key, content)
 
                     decoded = (
                         decrypted.decode("utf-8", errors="ignore")
@@ -189,14 +356,69 @@ async def get_shared_files(authorization: str = Header(...)):
                         "error": f"Error decrypting: {str(e)}"
                     }
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            tasks = [process_shared_file(f, client) for f in shared_files]
-            decrypted_files = await asyncio.gather(*tasks)
+        decrypted_files = await asyncio.gather(*[
+            process_shared_file(f, k) for f, k in zip(shared_files, aes_keys)
+        ])
 
         return {
             "message": "Shared files retrieved and decrypted successfully",
             "shared_files": decrypted_files
         }
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/download")
+async def download_shared_file(
+    file_name: str,
+    owner_email: str,
+    authorization: str = Header(...),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    try:
+        token = authorization.split(" ")[1]
+        decoded_token = verify_token(token)
+        if not decoded_token or decoded_token.get("role") != "user":
+            raise HTTPException(status_code=403, detail="Only users with role 'user' can access this endpoint")
+
+        user_id = decoded_token["user_id"]
+
+        def load_shared_file(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT is_locked, email FROM users WHERE id = %s", (user_id,))
+                row = cursor.fetchone()
+                if not row:
+                    raise HTTPException(status_code=404, detail="User not found")
+                is_locked, user_email = row
+                if is_locked:
+                    raise HTTPException(status_code=403, detail="Your account is locked")
+
+                cursor.execute("""
+                    SELECT f.file_type, f.file_url, sf.encrypted_aes_key
+                    FROM shared_files sf
+                    JOIN files f ON sf.file_id = f.id
+                    JOIN users o ON f.owner_id = o.id
+                    WHERE sf.shared_with = %s AND f.file_name = %s AND o.email = %s
+                    LIMIT 1
+                """, (user_id, file_name, owner_email))
+                file_row = cursor.fetchone()
+                if not file_row:
+                    raise HTTPException(status_code=404, detail="Shared file not found")
+                return user_email, file_row
+
+        user_email, (file_type, file_url, encrypted_aes_key) = await run_db(load_shared_file)
+
+        private_key = await get_private_key(user_id, user_email)
+        if private_key is None:
+            raise HTTPException(status_code=404, detail="Missing decryption keys")
+        file_key_hex = (await run_cpu(decrypt_rsa, private_key, int(encrypted_aes_key))).strip()
+
+        return await stream_decrypted_file(file_url, bytes.fromhex(file_key_hex), file_name, file_type, range_header)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
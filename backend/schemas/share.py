@@ -1,5 +1,11 @@
-from pydantic import BaseModel, EmailStr
+from typing import List
+from pydantic import BaseModel, EmailStr, Field
 
 class ShareFileRequest(BaseModel):
     file_name: str
     shared_with_email: EmailStr
+
+class BulkShareRequest(BaseModel):
+    # every listed file is shared with every listed recipient
+    file_names: List[str] = Field(..., min_length=1)
+    shared_with_emails: List[EmailStr] = Field(..., min_length=1)
@@ -1,5 +1,7 @@
 from supabase import create_client
 import os
+from urllib.parse import quote
+from http_client import fetch, delete
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,3 +10,37 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def _storage_headers(content_type: str = "application/octet-stream") -> dict:
+    return {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY,
+        "Content-Type": content_type,
+        "x-upsert": "false",
+    }
+
+
+async def upload_stream(bucket: str, path: str, chunks):
+    # the storage API accepts a chunked request body, so the blob is never held in memory
+    # not retried: the chunk generator cannot be replayed
+    # quoted so names with '#', '?' or '%' land on the object get_public_url points at
+    response = await fetch(
+        "POST",
+        f"{SUPABASE_URL}/storage/v1/object/{bucket}/{quote(path)}",
+        retry=False,
+        bulk=True,
+        content=chunks,
+        headers=_storage_headers(),
+    )
+    response.raise_for_status()
+
+
+async def remove_objects(bucket: str, paths: list):
+    # async counterpart of supabase.storage.from_(bucket).remove(paths)
+    response = await delete(
+        f"{SUPABASE_URL}/storage/v1/object/{bucket}",
+        json={"prefixes": paths},
+        headers=_storage_headers("application/json"),
+    )
+    response.raise_for_status()
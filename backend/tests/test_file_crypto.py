@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from Cryptodome.Cipher import AES
+from utils.file_crypto import encrypt_upload, decrypt_blob, PlaintextDigest, CIPHERS, HEADER
+
+CHUNK = 1024
+
+
+class FakeUpload:
+    # UploadFile's async read over an in-memory buffer
+    def __init__(self, data: bytes):
+        self.buffer = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.buffer.read(size)
+
+
+def encrypt(data: bytes, key: bytes, cipher_id: int, digest=None) -> bytes:
+    async def collect():
+        parts = []
+        async for part in encrypt_upload(FakeUpload(data), key, CHUNK, digest=digest, cipher_id=cipher_id):
+            parts.append(part)
+        return b"".join(parts)
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("cipher_id", CIPHERS.values())
+@pytest.mark.parametrize("size", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK])
+def test_round_trip(cipher_id, size):
+    key = os.urandom(32)
+    data = os.urandom(size)
+    digest = PlaintextDigest()
+    blob = encrypt(data, key, cipher_id, digest)
+    assert decrypt_blob(key, blob) == data
+    assert digest.size == size
+
+
+@pytest.mark.parametrize("cipher_id", CIPHERS.values())
+def test_truncation_is_detected(cipher_id):
+    key = os.urandom(32)
+    blob = encrypt(os.urandom(3 * CHUNK), key, cipher_id)
+    # a dropped byte, a dropped final segment and a header with no body
+    for truncated in (blob[:-1], blob[:-(CHUNK + 16)], blob[:HEADER.size]):
+        with pytest.raises(ValueError):
+            decrypt_blob(key, truncated)
+
+
+@pytest.mark.parametrize("cipher_id", CIPHERS.values())
+def test_tampering_is_detected(cipher_id):
+    key = os.urandom(32)
+    blob = bytearray(encrypt(os.urandom(2 * CHUNK + 10), key, cipher_id))
+    segment = CHUNK + 16
+    swapped = bytes(blob[:HEADER.size] + blob[HEADER.size + segment:HEADER.size + 2 * segment]
+                    + blob[HEADER.size:HEADER.size + segment] + blob[HEADER.size + 2 * segment:])
+    blob[-1] ^= 1
+    for tampered in (bytes(blob), swapped):
+        with pytest.raises(ValueError):
+            decrypt_blob(key, tampered)
+
+
+def test_legacy_blob_still_decrypts():
+    key = os.urandom(32)
+    data = os.urandom(100)
+    cipher = AES.new(key, AES.MODE_EAX)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    assert decrypt_blob(key, cipher.nonce + tag + ciphertext) == data
@@ -0,0 +1,34 @@
+import os
+import asyncio
+
+from keystore import key_store
+from utils.aes import decrypt_private_key
+from utils.rsa import parse_private_key
+from utils.key_cache import PrivateKeyCache
+
+private_key_cache = PrivateKeyCache(
+    max_entries=int(os.getenv("PRIVATE_KEY_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("PRIVATE_KEY_CACHE_TTL", "300"))
+)
+
+
+def _load_private_key(user_id, email: str):
+    keys = key_store.get_keys(user_id, email)
+    if keys is None:
+        return None
+    encrypted_private_key, aes_key_hex = keys
+    return parse_private_key(decrypt_private_key(encrypted_private_key, bytes.fromhex(aes_key_hex)))
+
+
+# Returns the user's parsed RSA private key, or None when no key is stored.
+async def get_private_key(user_id, email: str):
+    key = private_key_cache.get(user_id)
+    if key is None:
+        key = await asyncio.to_thread(_load_private_key, user_id, email)
+        if key is not None:
+            private_key_cache.put(user_id, key)
+    return key
+
+
+def invalidate_private_key(user_id):
+    private_key_cache.invalidate(user_id)
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+import threading
+
+# "auto" uses pg_trgm when the extension is installed and the in-process index otherwise
+USER_SEARCH_BACKEND = os.getenv("USER_SEARCH_BACKEND", "auto")
+# seconds between pulls of newly registered users into the in-process index
+USER_SEARCH_REFRESH = float(os.getenv("USER_SEARCH_REFRESH", "5"))
+# seconds between full rebuilds, which also pick up deleted users and role changes
+USER_SEARCH_REBUILD = float(os.getenv("USER_SEARCH_REBUILD", "600"))
+# seconds before "auto" looks for pg_trgm again after finding it missing, since
+# the online migrations may install it after the first search
+USER_SEARCH_TRGM_RECHECK = float(os.getenv("USER_SEARCH_TRGM_RECHECK", "60"))
+
+# Results are ranked by tier (0 exact, 1 prefix, 2 substring), then trigram
+# similarity, then email/id; the cursor is that 4-tuple of the last row.
+
+WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+def _escape_like(query: str) -> str:
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _word_trigrams(text: str) -> set:
+    # same padding as pg_trgm so scores line up with similarity()
+    grams = set()
+    for word in WORD_SPLIT.split(text.lower()):
+        if word:
+            padded = f"  {word} "
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _substring_trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+SEARCH_SQL = """
+    WITH matches AS (
+        SELECT id, email,
+               CASE WHEN lower(email) = lower(%(query)s) THEN 0
+                    WHEN email ILIKE %(prefix)s THEN 1
+                    ELSE 2 END AS tier,
+               similarity(email, %(query)s)::float8 AS score
+        FROM users
+        WHERE role = 'user' AND email ILIKE %(pattern)s
+    ),
+    page AS (
+        SELECT id, email, tier, score
+        FROM matches
+        WHERE %(after)s::int IS NULL
+           OR (tier, -score, email, id) > (%(after_tier)s, -%(after_score)s::float8, %(after_email)s, %(after_id)s)
+        ORDER BY tier, score DESC, email, id
+        LIMIT %(limit)s
+    )
+    SELECT t.total, p.id, p.email, p.tier, p.score
+    FROM (SELECT COUNT(*) AS total FROM matches) t
+    LEFT JOIN page p ON TRUE
+    ORDER BY p.tier, p.score DESC, p.email, p.id
+"""
+
+
+def _search_trgm(conn, query: str, limit: int, after):
+    escaped = _escape_like(query)
+    after_tier, after_score, after_email, after_id = after or (None, None, None, None)
+    with conn.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, {
+            "query": query,
+            "prefix": f"{escaped}%",
+            "pattern": f"%{escaped}%",
+            "after": 1 if after else None,
+            "after_tier": after_tier,
+            "after_score": after_score,
+            "after_email": after_email,
+            "after_id": after_id,
+            "limit": limit,
+        })
+        rows = cursor.fetchall()
+    total = rows[0][0] if rows else 0
+    return total, [r[1:] for r in rows if r[1] is not None]
+
+
+class UserSearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        # trigram of the lowercased email -> ids containing it, for substring lookups
+        self.postings = {}
+        self.max_id = 0
+        self.refreshed_at = 0.0
+        self.rebuilt_at = 0.0
+
+    def _index(self, user_id, email: str):
+        lowered = email.lower()
+        self.users[user_id] = (email, lowered, _word_trigrams(email))
+        for gram in _substring_trigrams(lowered):
+            self.postings.setdefault(gram, set()).add(user_id)
+        self.max_id = max(self.max_id, user_id)
+
+    def add(self, user_id, email: str, role: str = "user"):
+        with self.lock:
+            if self.rebuilt_at and role == "user" and user_id not in self.users:
+                self._index(user_id, email)
+
+    def refresh(self, conn):
+        now = time.monotonic()
+        with self.lock:
+            rebuild = now - self.rebuilt_at > USER_SEARCH_REBUILD
+            if not rebuild and now - self.refreshed_at < USER_SEARCH_REFRESH:
+                return
+            with conn.cursor() as cursor:
+                if rebuild:
+                    cursor.execute("SELECT id, email FROM users WHERE role = 'user'")
+                    self.users, self.postings, self.max_id = {}, {}, 0
+                    self.rebuilt_at = now
+                else:
+                    cursor.execute("SELECT id, email FROM users WHERE role = 'user' AND id > %s", (self.max_id,))
+                for user_id, email in cursor.fetchall():
+                    if user_id not in self.users:
+                        self._index(user_id, email)
+            self.refreshed_at = now
+
+    def _candidates(self, lowered: str):
+        grams = _substring_trigrams(lowered)
+        if not grams:
+            # one or two characters have no trigram to look up
+            return self.users.keys()
+        postings = sorted((self.postings.get(g, set()) for g in grams), key=len)
+        return set.intersection(*postings)
+
+    def search(self, query: str):
+        lowered = query.lower()
+        query_grams = _word_trigrams(query)
+        matches = []
+        with self.lock:
+            for user_id in self._candidates(lowered):
+                email, lowered_email, grams = self.users[user_id]
+                if lowered not in lowered_email:
+                    continue
+                tier = 0 if lowered_email == lowered else 1 if lowered_email.startswith(lowered) else 2
+                matches.append((user_id, email, tier, _similarity(grams, query_grams)))
+        matches.sort(key=_rank_key)
+        return matches
+
+
+def _rank_key(row):
+    user_id, email, tier, score = row
+    return tier, -score, email, user_id
+
+
+user_search_index = UserSearchIndex()
+_use_trgm = None
+_trgm_checked_at = 0.0
+
+
+def _trgm_available(conn) -> bool:
+    # a positive answer is kept; a negative one only for USER_SEARCH_TRGM_RECHECK
+    global _use_trgm, _trgm_checked_at
+    if USER_SEARCH_BACKEND in ("trgm", "memory"):
+        return USER_SEARCH_BACKEND == "trgm"
+    if _use_trgm is None or (not _use_trgm and time.monotonic() - _trgm_checked_at >= USER_SEARCH_TRGM_RECHECK):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _use_trgm = cursor.fetchone() is not None
+        _trgm_checked_at = time.monotonic()
+    return bool(_use_trgm)
+
+
+def search_users(conn, query: str, limit: int, after=None):
+    # returns (total, [(id, email, tier, score), ...])
+    if _trgm_available(conn):
+        return _search_trgm(conn, query, limit, after)
+
+    user_search_index.refresh(conn)
+    matches = user_search_index.search(query)
+    if after:
+        after_key = _rank_key((after[3], after[2], after[0], after[1]))
+        page = [m for m in matches if _rank_key(m) > after_key]
+    else:
+        page = matches
+    return len(matches), page[:limit]
@@ -0,0 +1,135 @@
+import re
+import asyncio
+from urllib.parse import quote
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from http_client import fetch, stream
+from utils.file_crypto import (
+    HEADER, ChunkDecryptor, chunk_count, plaintext_size, is_chunked, decrypt_blob
+)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: str, size: int):
+    if not range_header:
+        return None
+
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+async def _read_blob_size(file_url: str):
+    response = await fetch("GET", file_url, headers={"Range": f"bytes=0-{HEADER.size - 1}"})
+    response.raise_for_status()
+    if response.status_code == 206:
+        total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+        return response.content, total, None
+    # storage ignored the range and sent the whole blob
+    return response.content[:HEADER.size], len(response.content), response.content
+
+
+def _response_headers(file_name: str, size: int, byte_range):
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_name)}",
+    }
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+    else:
+        headers["Content-Length"] = str(size)
+    return headers
+
+
+async def stream_decrypted_file(file_url: str, aes_key: bytes, file_name: str, file_type: str, range_header: str = None):
+    head, blob_size, whole_blob = await _read_blob_size(file_url)
+
+    if not is_chunked(head):
+        # legacy single-shot EAX blobs can only be verified once fully read
+        if whole_blob is None:
+            response = await fetch("GET", file_url)
+            response.raise_for_status()
+            whole_blob = response.content
+        return _buffered_response(await asyncio.to_thread(decrypt_blob, aes_key, whole_blob),
+                                  file_name, file_type, range_header)
+
+    decryptor = ChunkDecryptor(aes_key, head)
+    chunk_size = decryptor.chunk_size
+    segment_size = decryptor.segment_size
+    total_chunks = chunk_count(blob_size, chunk_size)
+    size = plaintext_size(blob_size, chunk_size)
+
+    byte_range = parse_range(range_header, size) if size else None
+    start, end = byte_range or (0, size - 1)
+    first_chunk = start // chunk_size
+    last_chunk = max(end, 0) // chunk_size
+    cipher_start = HEADER.size + first_chunk * segment_size
+    cipher_end = min(HEADER.size + (last_chunk + 1) * segment_size, blob_size) - 1
+
+    async def body():
+        index = first_chunk
+        buffer = bytearray()
+        async with stream("GET", file_url, headers={"Range": f"bytes={cipher_start}-{cipher_end}"}) as response:
+            response.raise_for_status()
+            # a 200 means the range was ignored and the blob starts from byte 0
+            skip = cipher_start if response.status_code == 200 else 0
+            async for data in response.aiter_bytes():
+                if skip:
+                    dropped = min(skip, len(data))
+                    data, skip = data[dropped:], skip - dropped
+                buffer.extend(data)
+                while index <= last_chunk:
+                    last = index == total_chunks - 1
+                    needed = blob_size - HEADER.size - index * segment_size if last else segment_size
+                    if len(buffer) < needed:
+                        break
+                    plaintext = decryptor.decrypt_chunk(index, bytes(buffer[:needed]), last)
+                    del buffer[:needed]
+
+                    chunk_offset = index * chunk_size
+                    lower = max(start - chunk_offset, 0)
+                    upper = min(end - chunk_offset + 1, len(plaintext))
+                    index += 1
+                    if upper > lower:
+                        yield plaintext[lower:upper]
+
+        if index <= last_chunk:
+            raise ValueError("Encrypted file is truncated")
+
+    return StreamingResponse(
+        body(),
+        status_code=206 if byte_range else 200,
+        media_type=file_type or "application/octet-stream",
+        headers=_response_headers(file_name, size, byte_range),
+    )
+
+
+def _buffered_response(plaintext: bytes, file_name: str, file_type: str, range_header: str = None):
+    size = len(plaintext)
+    byte_range = parse_range(range_header, size) if size else None
+    start, end = byte_range or (0, size - 1)
+
+    async def body():
+        yield plaintext[start:end + 1]
+
+    return StreamingResponse(
+        body(),
+        status_code=206 if byte_range else 200,
+        media_type=file_type or "application/octet-stream",
+        headers=_response_headers(file_name, size, byte_range),
+    )
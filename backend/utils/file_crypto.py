@@ -0,0 +1,203 @@
+import os
+import struct
+import hashlib
+from Cryptodome.Cipher import AES, ChaCha20_Poly1305
+from Cryptodome.Random import get_random_bytes
+
+# Chunked blob layout (STREAM construction):
+#   v1 header: MAGIC(4) | version=1(1) | chunk_size(4) | nonce_prefix(11)            AES-EAX
+#   v2 header: MAGIC(4) | version=2(1) | cipher(1) | chunk_size(4) | nonce_prefix(7) | reserved(3)
+#   body:      one (ciphertext + tag) segment per plaintext chunk
+# Each chunk nonce is nonce_prefix | counter(4) | last_flag(1), so chunks
+# cannot be reordered, dropped or truncated without failing verification.
+# v2 also authenticates the header as associated data of every chunk.
+# Both headers are 20 bytes, so segment offsets do not depend on the version.
+# Blobs without the magic are legacy single-shot EAX: nonce(16) | tag(16) | ciphertext.
+
+MAGIC = b"CDRV"
+VERSION = 1
+VERSION_CIPHER_ID = 2
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 11
+HEADER = struct.Struct(">4sBI11s")
+HEADER_V2 = struct.Struct(">4sBBI7s3x")
+
+CIPHER_AES_EAX = 1
+CIPHER_AES_GCM = 2
+CIPHER_CHACHA20_POLY1305 = 3
+CIPHERS = {
+    "aes-eax": CIPHER_AES_EAX,
+    "aes-gcm": CIPHER_AES_GCM,
+    "chacha20-poly1305": CIPHER_CHACHA20_POLY1305,
+}
+# cipher written by new uploads; every cipher above stays readable
+DEFAULT_CIPHER = CIPHERS[os.getenv("FILE_CIPHER", "aes-gcm")]
+
+
+def _chunk_nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+
+def _new_cipher(cipher_id: int, key: bytes, nonce: bytes):
+    if cipher_id == CIPHER_AES_EAX:
+        return AES.new(key, AES.MODE_EAX, nonce=nonce)
+    if cipher_id == CIPHER_AES_GCM:
+        return AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if cipher_id == CIPHER_CHACHA20_POLY1305:
+        return ChaCha20_Poly1305.new(key=key, nonce=nonce)
+    raise ValueError("Unsupported cipher")
+
+
+class ChunkEncryptor:
+    def __init__(self, aes_key: bytes, chunk_size: int = CHUNK_SIZE, cipher_id: int = None):
+        self.aes_key = aes_key
+        self.chunk_size = chunk_size
+        self.cipher_id = DEFAULT_CIPHER if cipher_id is None else cipher_id
+        if self.cipher_id == CIPHER_AES_EAX:
+            self.nonce_prefix = get_random_bytes(NONCE_PREFIX_SIZE)
+            self.associated_data = None
+        else:
+            # 12-byte nonces for GCM and ChaCha20-Poly1305
+            self.nonce_prefix = get_random_bytes(7)
+            self.associated_data = self.header()
+        self.counter = 0
+        self.finished = False
+
+    def header(self) -> bytes:
+        if self.cipher_id == CIPHER_AES_EAX:
+            return HEADER.pack(MAGIC, VERSION, self.chunk_size, self.nonce_prefix)
+        return HEADER_V2.pack(MAGIC, VERSION_CIPHER_ID, self.cipher_id, self.chunk_size, self.nonce_prefix)
+
+    def encrypt_chunk(self, chunk: bytes, last: bool = False) -> bytes:
+        if self.finished:
+            raise ValueError("Stream already finalized")
+        if len(chunk) > self.chunk_size or (not last and len(chunk) != self.chunk_size):
+            raise ValueError("Only the last chunk may be shorter than the chunk size")
+
+        nonce = _chunk_nonce(self.nonce_prefix, self.counter, last)
+        cipher = _new_cipher(self.cipher_id, self.aes_key, nonce)
+        if self.associated_data:
+            cipher.update(self.associated_data)
+        ciphertext, tag = cipher.encrypt_and_digest(chunk)
+        self.counter += 1
+        self.finished = last
+        return ciphertext + tag
+
+
+class ChunkDecryptor:
+    def __init__(self, aes_key: bytes, header: bytes):
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError("Unsupported file format")
+        version = header[len(MAGIC)]
+        if version == VERSION:
+            _, _, chunk_size, nonce_prefix = HEADER.unpack(header)
+            self.cipher_id = CIPHER_AES_EAX
+            self.associated_data = None
+        elif version == VERSION_CIPHER_ID:
+            _, _, self.cipher_id, chunk_size, nonce_prefix = HEADER_V2.unpack(header)
+            self.associated_data = bytes(header)
+        else:
+            raise ValueError("Unsupported file format")
+        if self.cipher_id not in CIPHERS.values():
+            raise ValueError("Unsupported cipher")
+        self.aes_key = aes_key
+        self.chunk_size = chunk_size
+        self.segment_size = chunk_size + TAG_SIZE
+        self.nonce_prefix = nonce_prefix
+        self.counter = 0
+        self.buffer = bytearray()
+
+    def decrypt_chunk(self, index: int, segment: bytes, last: bool) -> bytes:
+        nonce = _chunk_nonce(self.nonce_prefix, index, last)
+        cipher = _new_cipher(self.cipher_id, self.aes_key, nonce)
+        if self.associated_data:
+            cipher.update(self.associated_data)
+        return cipher.decrypt_and_verify(segment[:-TAG_SIZE], segment[-TAG_SIZE:])
+
+    def _decrypt_segment(self, segment: bytes, last: bool) -> bytes:
+        plaintext = self.decrypt_chunk(self.counter, segment, last)
+        self.counter += 1
+        return plaintext
+
+    def feed(self, data: bytes):
+        self.buffer.extend(data)
+        # a full segment is only known not to be the last one once more bytes follow it
+        while len(self.buffer) > self.segment_size:
+            segment = bytes(self.buffer[:self.segment_size])
+            del self.buffer[:self.segment_size]
+            yield self._decrypt_segment(segment, last=False)
+
+    def finalize(self) -> bytes:
+        if len(self.buffer) < TAG_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        plaintext = self._decrypt_segment(bytes(self.buffer), last=True)
+        self.buffer.clear()
+        return plaintext
+
+
+def chunk_count(blob_size: int, chunk_size: int) -> int:
+    body = blob_size - HEADER.size
+    if body < TAG_SIZE:
+        raise ValueError("Encrypted file is truncated")
+    return -(-body // (chunk_size + TAG_SIZE))
+
+
+def plaintext_size(blob_size: int, chunk_size: int) -> int:
+    return blob_size - HEADER.size - chunk_count(blob_size, chunk_size) * TAG_SIZE
+
+
+def is_chunked(blob: bytes) -> bool:
+    return blob[:len(MAGIC)] == MAGIC
+
+
+def decrypt_blob(aes_key: bytes, blob: bytes) -> bytes:
+    if not is_chunked(blob):
+        nonce, tag, ciphertext = blob[:16], blob[16:32], blob[32:]
+        return AES.new(aes_key, AES.MODE_EAX, nonce=nonce).decrypt_and_verify(ciphertext, tag)
+
+    decryptor = ChunkDecryptor(aes_key, blob[:HEADER.size])
+    parts = list(decryptor.feed(blob[HEADER.size:]))
+    parts.append(decryptor.finalize())
+    return b"".join(parts)
+
+
+class PlaintextDigest:
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data: bytes):
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+
+async def _read_chunk(upload_file, chunk_size: int) -> bytes:
+    chunk = await upload_file.read(chunk_size)
+    while chunk and len(chunk) < chunk_size:
+        more = await upload_file.read(chunk_size - len(chunk))
+        if not more:
+            break
+        chunk += more
+    return chunk
+
+
+async def encrypt_upload(upload_file, aes_key: bytes, chunk_size: int = CHUNK_SIZE,
+                         digest: PlaintextDigest = None, cipher_id: int = None):
+    encryptor = ChunkEncryptor(aes_key, chunk_size, cipher_id)
+    yield encryptor.header()
+
+    # read one chunk ahead so the final chunk can be flagged as last
+    current = await _read_chunk(upload_file, chunk_size)
+    while True:
+        if digest is not None:
+            digest.update(current)
+        following = await _read_chunk(upload_file, chunk_size)
+        if not following:
+            yield encryptor.encrypt_chunk(current, last=True)
+            return
+        yield encryptor.encrypt_chunk(current)
+        current = following
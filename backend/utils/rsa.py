@@ -1,28 +1,41 @@
-import random
-
-first_primes_list = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29,
-					31, 37, 41, 43, 47, 53, 59, 61, 67,
-					71, 73, 79, 83, 89, 97, 101, 103,
-					107, 109, 113, 127, 131, 137, 139,
-					149, 151, 157, 163, 167, 173, 179,
-					181, 191, 193, 197, 199, 211, 223,
-					227, 229, 233, 239, 241, 251, 257,
-					263, 269, 271, 277, 281, 283, 293,
-					307, 311, 313, 317, 331, 337, 347, 349]
+import math
+import secrets
+from collections import namedtuple
+
+PUBLIC_EXPONENT = 65537
+
+
+def _small_primes(limit):
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0:2] = b"\x00\x00"
+    for i in range(2, math.isqrt(limit) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytearray(len(range(i * i, limit + 1, i)))
+    return [i for i, is_prime in enumerate(sieve) if is_prime]
+
+# trial division by every prime below 2^14 is one gcd against their product
+first_primes_list = _small_primes(1 << 14)
+small_primes_product = math.prod(first_primes_list)
 
 def nBitRandom(n):
-    return random.randrange(2**(n - 1) + 1, 2**n - 1)
+    # top two bits set so that p * q always has exactly 2n bits
+    return secrets.randbits(n) | (3 << (n - 2)) | 1
 
 def getLowLevelPrime(n):
     while True:
         pc = nBitRandom(n)
-        for divisor in first_primes_list:
-            if pc % divisor == 0 and divisor**2 <= pc:
-                break
-        else:
+        if math.gcd(pc, small_primes_product) == 1:
             return pc
 
-def isMillerRabinPassed(mrc):
+def millerRabinRounds(bits):
+    # FIPS 186-4 appendix C.3: enough rounds for a 2^-100 error bound on random candidates
+    if bits >= 1024:
+        return 5
+    if bits >= 512:
+        return 7
+    return 20
+
+def isMillerRabinPassed(mrc, rounds=None):
     maxDivByTwo = 0
     ec = mrc - 1
     while ec % 2 == 0:
@@ -30,31 +43,28 @@ def isMillerRabinPassed(mrc):
         maxDivByTwo += 1
     assert (2 ** maxDivByTwo * ec == mrc - 1)
 
-    for _ in range(20): 
-        tester = random.randrange(2, mrc)
-        if pow(tester, ec, mrc) == 1:
+    for _ in range(rounds or millerRabinRounds(mrc.bit_length())):
+        tester = secrets.randbelow(mrc - 3) + 2
+        x = pow(tester, ec, mrc)
+        if x == 1 or x == mrc - 1:
             continue
-        for i in range(maxDivByTwo):
-            if pow(tester, 2 ** i * ec, mrc) == mrc - 1:
+        for _ in range(maxDivByTwo - 1):
+            x = pow(x, 2, mrc)
+            if x == mrc - 1:
                 break
         else:
             return False
     return True
 
-def generatePrime(n):
+def generatePrime(n, e=PUBLIC_EXPONENT):
     while True:
         candidate = getLowLevelPrime(n)
-        if isMillerRabinPassed(candidate):
+        # p - 1 must be coprime with e for d to exist
+        if candidate % e != 1 and isMillerRabinPassed(candidate):
             return candidate
 
 def moduloExp(a, m, n):
-    binary = bin(m)[2:]
-    d = 1
-    for bit in binary:
-        d = (d * d) % n
-        if bit == '1':
-            d = (d * a) % n
-    return d
+    return pow(a, m, n)
 
 
 def EuclidGCD(a, b):
@@ -80,16 +90,15 @@ def generate_rsa_keys(bits=512):
 
     n = p * q
     phi = (p - 1) * (q - 1)
-
-    while True:
-        e = random.randrange(2, phi)
-        if EuclidGCD(e, phi) == 1:
-            break
+    e = PUBLIC_EXPONENT
 
     d = mulInverse(e, phi)
+    dp = d % (p - 1)
+    dq = d % (q - 1)
+    qinv = mulInverse(q, p)
 
     public_key = f"{e},{n}"
-    private_key = f"{d},{n}"
+    private_key = f"{d},{n},{p},{q},{dp},{dq},{qinv}"
     return public_key, private_key
 
 def encrypt_rsa(public_key, plaintext):
@@ -99,8 +108,51 @@ def encrypt_rsa(public_key, plaintext):
     ciphertext = moduloExp(plaintext_int, e, n)
     return ciphertext
 
+# keys issued before CRT support only carry "d,n"; p and friends are None for those
+RSAPrivateKey = namedtuple("RSAPrivateKey", ["d", "n", "p", "q", "dp", "dq", "qinv"])
+
+
+def parse_private_key(private_key):
+    if isinstance(private_key, RSAPrivateKey):
+        return private_key
+    parts = list(map(int, private_key.split(",")))
+    if len(parts) == 2:
+        return RSAPrivateKey(parts[0], parts[1], None, None, None, None, None)
+    return RSAPrivateKey(*parts)
+
+
+def rsa_private_op(key, ciphertext):
+    if key.p is None:
+        return pow(ciphertext, key.d, key.n)
+    m1 = pow(ciphertext, key.dp, key.p)
+    m2 = pow(ciphertext, key.dq, key.q)
+    h = (key.qinv * (m1 - m2)) % key.p
+    return m2 + h * key.q
+
+
 def decrypt_rsa(private_key, ciphertext):
-    d, n = map(int, private_key.split(","))
-    plaintext_int = moduloExp(ciphertext, d, n)
+    plaintext_int = rsa_private_op(parse_private_key(private_key), ciphertext)
     plaintext_bytes = plaintext_int.to_bytes((plaintext_int.bit_length() + 7) // 8, byteorder='big')
-    return plaintext_bytes.decode('utf-8', errors='ignore')
\ No newline at end of file
+    return plaintext_bytes.decode('utf-8', errors='ignore')
+
+
+def unwrap_aes_keys(private_key, ciphertexts):
+    # one key parse for the whole batch; entries that do not decode come back as None
+    key = parse_private_key(private_key)
+    aes_keys = []
+    for ciphertext in ciphertexts:
+        try:
+            aes_keys.append(bytes.fromhex(decrypt_rsa(key, int(ciphertext)).strip()))
+        except ValueError:
+            aes_keys.append(None)
+    return aes_keys
+
+
+def rewrap_aes_key(private_key, ciphertext, recipient_public_key):
+    # owner's wrapped key -> the same AES key wrapped for the recipient, in one worker task
+    return encrypt_rsa(recipient_public_key, decrypt_rsa(private_key, int(ciphertext)))
+
+
+def wrap_aes_keys(aes_keys_hex, targets):
+    # targets are (key_id, public_key) pairs; each AES key is wrapped for its public key
+    return [encrypt_rsa(public_key, aes_keys_hex[key_id]) for key_id, public_key in targets]
@@ -9,7 +9,8 @@ import {
   lockUser,
   unlockUser,
   getUserActivity,
-  getAllActivityLogs
+  getAllActivityLogs,
+  exportActivityLogs
 } from "../services/api";
 import { 
   BarChart, 
@@ -144,15 +145,19 @@ export default function AdminPanel() {
 
   const [activityPage, setActivityPage] = useState(1);
   const [activityTotal, setActivityTotal] = useState(0);
+  const [recentActivityCursor, setRecentActivityCursor] = useState(null);
   const activityLimit = 10;
   
-  const fetchActivity = async (page = 1, fetchAll = false) => {
+  // recent: the dashboard works from the newest page of the full log and
+  // pulls older pages only when asked (loadOlderActivity)
+  const fetchActivity = async (page = 1, recent = false) => {
     try {
-      if (fetchAll) {
+      if (recent) {
         const res = await getAllActivityLogs();
         setActivityLogs(res.logs);
         setActivityPage(1);
         setActivityTotal(res.logs.length);
+        setRecentActivityCursor(res.next_cursor);
       } else {
         const res = await getActivityLog(page, activityLimit);
         setActivityLogs(res.logs);
@@ -163,6 +168,31 @@ export default function AdminPanel() {
       console.error("Failed to load activity log", err);
     }
   };
+
+  const loadOlderActivity = async () => {
+    if (!recentActivityCursor) return;
+    try {
+      const res = await getAllActivityLogs(recentActivityCursor);
+      setActivityLogs((prev) => [...prev, ...res.logs]);
+      setActivityTotal((prev) => prev + res.logs.length);
+      setRecentActivityCursor(res.next_cursor);
+    } catch (err) {
+      console.error("Failed to load older activity", err);
+    }
+  };
+
+  const handleExportActivity = async (format = "csv") => {
+    try {
+      const blobUrl = URL.createObjectURL(await exportActivityLogs(format));
+      const link = document.createElement("a");
+      link.href = blobUrl;
+      link.download = `activity.${format}`;
+      link.click();
+      setTimeout(() => URL.revokeObjectURL(blobUrl), 0);
+    } catch (err) {
+      console.error("Failed to export activity log", err);
+    }
+  };
   
   
 
@@ -436,6 +466,13 @@ export default function AdminPanel() {
                     </ResponsiveContainer>
                   </div>
                 </div>
+
+                {recentActivityCursor && (
+                  <div className="pagination-controls">
+                    <span>Charts cover the {activityLogs.length} most recent events</span>
+                    <button onClick={loadOlderActivity}>Load older activity</button>
+                  </div>
+                )}
               </div>
             )}
 
@@ -596,6 +633,12 @@ export default function AdminPanel() {
                   >
                     Reset
                   </button>
+                  <button
+                    className="reset-button"
+                    onClick={() => handleExportActivity("csv")}
+                  >
+                    Export CSV
+                  </button>
                 </div>
 
                 {/* Log Table */}
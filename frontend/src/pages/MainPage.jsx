@@ -2,6 +2,7 @@ import { useEffect, useRef, useState } from "react";
 import {
   getUserDetails,
   getUserFiles,
+  downloadFile,
   getSharedFiles,
   uploadFile,
   shareFile,
@@ -15,6 +16,8 @@ import ErrorOverlay from "../components/UploadErrorOverlay";
 
 export default function MainPage() {
   const [files, setFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [isUploading, setIsUploading] = useState(false);
   const [viewMode, setViewMode] = useState("my-files");
@@ -39,6 +42,11 @@ export default function MainPage() {
     fetchUser();
   }, []);
 
+  // object URLs made for previews are released once the preview closes
+  useEffect(() => () => {
+    if (previewFile?.blobUrl) URL.revokeObjectURL(previewFile.blobUrl);
+  }, [previewFile]);
+
   useEffect(() => {
     if (email) fetchFiles(viewMode);
     setPreviewFile(null);
@@ -63,6 +71,7 @@ export default function MainPage() {
   const fetchFiles = async (mode) => {
     setLoading(true);
     setFiles([]);
+    setNextCursor(null);
     const fetchId = ++currentFetchId.current;
     try {
       const res = mode === "my-files" ? await getUserFiles() : await getSharedFiles();
@@ -70,6 +79,7 @@ export default function MainPage() {
       if (fetchId === currentFetchId.current) {
         const fileList = mode === "my-files" ? res.files : res.shared_files;
         setFiles(fileList);
+        setNextCursor(mode === "my-files" ? res.next_cursor : null);
   
         if (res.corrupted_files && res.corrupted_files.length > 0) {
           setErrorTitle("Some Files Are Corrupted");
@@ -87,6 +97,24 @@ export default function MainPage() {
   };
   
 
+  // my-files is paged: the next page is only requested when the user asks for it
+  const loadMoreFiles = async () => {
+    if (!nextCursor || loadingMore) return;
+    const fetchId = currentFetchId.current;
+    setLoadingMore(true);
+    try {
+      const res = await getUserFiles(nextCursor);
+      if (fetchId === currentFetchId.current) {
+        setFiles((prev) => [...prev, ...res.files]);
+        setNextCursor(res.next_cursor);
+      }
+    } catch (err) {
+      console.error("Failed to load more files:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (file_name) => {
     if (window.confirm(`Are you sure you want to delete "${file_name}"?`)) {
       try {
@@ -124,7 +152,8 @@ export default function MainPage() {
     const generateThumbnails = async () => {
       const thumbnails = {};
       for (const file of files) {
-        if (file.file_type === "application/pdf") {
+        // only shared files arrive with content; my-files are listed as metadata
+        if (file.file_type === "application/pdf" && file.decrypted_content) {
           const thumbnail = await generatePDFThumbnail(file.decrypted_content);
           if (thumbnail) {
             thumbnails[file.file_name] = thumbnail;
@@ -138,14 +167,47 @@ export default function MainPage() {
     }
   }, [files]);
 
-  const handleDownload = (file) => {
+  const handleDownload = async (file) => {
     const link = document.createElement("a");
-    link.href = `data:${file.file_type};base64,${file.decrypted_content}`;
     link.download = file.file_name;
-    link.click();
+    if (file.decrypted_content) {
+      link.href = `data:${file.file_type};base64,${file.decrypted_content}`;
+      link.click();
+      return;
+    }
+    try {
+      const blobUrl = URL.createObjectURL(await downloadFile(file.file_name));
+      link.href = blobUrl;
+      link.click();
+      setTimeout(() => URL.revokeObjectURL(blobUrl), 0);
+    } catch (err) {
+      console.error("Download failed:", err);
+      alert("Could not download the file.");
+    }
   };
 
-  const handlePreview = (file) => {
+  const handlePreview = async (file) => {
+    if (!file.decrypted_content) {
+      const previewable = file.file_type === "application/pdf" || file.file_type?.startsWith("image/");
+      if (!previewable || (file.file_size || 0) > MAX_PREVIEW_SIZE) {
+        if (previewable) alert("The file is too large to preview. Please download it.");
+        return;
+      }
+      try {
+        const blob = await downloadFile(file.file_name);
+        // older uploads have no recorded size, so check the downloaded blob too
+        if (blob.size > MAX_PREVIEW_SIZE) {
+          alert("The file is too large to preview. Please download it.");
+          return;
+        }
+        setPreviewFile({ ...file, blobUrl: URL.createObjectURL(blob) });
+      } catch (err) {
+        console.error("Preview failed:", err);
+        alert("Could not open the file.");
+      }
+      return;
+    }
+
     if (file.file_type === "application/pdf") {
       const byteCharacters = atob(file.decrypted_content);
       const byteNumbers = new Array(byteCharacters.length)
@@ -179,7 +241,7 @@ export default function MainPage() {
         setIsUploading(true);
         const res = await uploadFile(file);
         if (viewMode === "my-files" && res.file) {
-          setFiles((prevFiles) => [...prevFiles, res.file]);
+          fetchFiles(viewMode);
         }
         setSuccessMessage("File uploaded successfully!");
         setShowSuccessOverlay(true);
@@ -276,7 +338,7 @@ export default function MainPage() {
             files.map((file) => (
               <div key={file.file_name} className="file-tile">
                 <div className="file-thumbnail" onClick={() => handlePreview(file)}>
-                  {file.file_type?.startsWith("image/") ? (
+                  {file.file_type?.startsWith("image/") && file.decrypted_content ? (
                     <img src={`data:${file.file_type};base64,${file.decrypted_content}`} alt={file.file_name} />
                   ) : file.file_type === "application/pdf" ? (
                     <img
@@ -315,6 +377,12 @@ export default function MainPage() {
           )}
         </div>
 
+        {!loading && nextCursor && (
+          <button className="load-more-button" onClick={loadMoreFiles} disabled={loadingMore}>
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        )}
+
         {previewFile && (
           <div className="preview-overlay" onClick={() => setPreviewFile(null)}>
             <div className="preview-content" onClick={(e) => e.stopPropagation()}>
@@ -338,7 +406,7 @@ export default function MainPage() {
                     ✕
                   </button>
                   <img
-                    src={`data:${previewFile.file_type};base64,${previewFile.decrypted_content}`}
+                    src={previewFile.blobUrl || `data:${previewFile.file_type};base64,${previewFile.decrypted_content}`}
                     alt={previewFile.file_name}
                     style={{ maxWidth: "100%", maxHeight: "80vh" }}
                   />
@@ -21,8 +21,20 @@ export const uploadFile = async (file) => {
     return response.data;
 };
 
-export const getUserFiles = async () => {
-    const response = await api.get("/files/my-files");
+// One page of metadata; content is fetched per file through downloadFile
+// when the user opens it.
+export const getUserFiles = async (cursor = null, limit = 50) => {
+    const response = await api.get("/files/my-files", {
+        params: { limit, cursor: cursor || undefined },
+    });
+    return response.data;
+};
+
+export const downloadFile = async (file_name) => {
+    const response = await api.get("/files/download", {
+        params: { file_name },
+        responseType: "blob",
+    });
     return response.data;
 };
 
@@ -51,8 +63,18 @@ export const shareFile = async (file_name, shared_with_email, permission) => {
     return res.data;
 };
 
+export const shareFiles = async (file_names, shared_with_emails) => {
+    const res = await api.post("/share/share-files", {
+      file_names,
+      shared_with_emails,
+    });
+    return res.data;
+};
+
 export const getSharedFiles = async () => {
-    const res = await api.get("/share/shared-files");
+    const res = await api.get("/share/shared-files", {
+        params: { include_content: true },
+    });
     return res.data;
 };
 
@@ -66,11 +88,31 @@ export const previewFile = async (fileName) => {
     return res.data;
 };
 
+// Admin lists are keyset-paginated: remember the cursor that starts each page
+// so the page-number UI can move back and forth.
+const pageCursors = {};
+
+const getCursorPage = async (path, params, page, limit) => {
+  const key = JSON.stringify([path, params, limit]);
+  const cursors = pageCursors[key] || (pageCursors[key] = { 1: null });
+
+  let known = page;
+  while (!(known in cursors)) known -= 1;
+
+  let data;
+  for (let current = known; current <= page; current += 1) {
+    const res = await api.get(path, {
+      params: { ...params, limit, cursor: cursors[current] || undefined },
+    });
+    data = res.data;
+    if (data.next_cursor) cursors[current + 1] = data.next_cursor;
+    if (!data.next_cursor && current < page) break;
+  }
+  return { ...data, page };
+};
+
 export const getAllUsers = async (page = 1, limit = 10) => {
-  const res = await api.get("/admin/users", {
-    params: { page, limit },
-  });
-  return res.data;
+  return getCursorPage("/admin/users", {}, page, limit);
 };
 
 
@@ -94,10 +136,7 @@ export const getAdminStats = async () => {
 };
 
 export const getActivityLog = async (page = 1, limit = 10) => {
-  const res = await api.get("/admin/activity-log", {
-    params: { page, limit },
-  });
-  return res.data;
+  return getCursorPage("/admin/activity-log", {}, page, limit);
 };
 
 
@@ -116,18 +155,12 @@ export const getSuspiciousActivity = async ({ page = 1, limit = 10, startDate, e
 
 
 export const getUserActivity = async (email, page = 1, limit = 10) => {
-  const res = await api.get("/admin/user-activity", {
-    params: { email, page, limit },
-  });
-  return res.data;
+  return getCursorPage("/admin/user-activity", { email }, page, limit);
 };
 
 
 export const searchUsers = async (query, page = 1, limit = 10) => {
-  const res = await api.get("/admin/search-users", {
-    params: { query, page, limit },
-  });
-  return res.data;
+  return getCursorPage("/admin/search-users", { query }, page, limit);
 };
 
 
@@ -152,8 +185,20 @@ export const unlockUser = async (email) => {
   return res.data;
 };
 
-export const getAllActivityLogs = async () => {
-  const res = await api.get("/admin/allactivity");
+// One keyset page of the full log, newest first; pass next_cursor for older rows.
+export const getAllActivityLogs = async (cursor = null, limit = 500) => {
+  const res = await api.get("/admin/allactivity", {
+    params: { limit, cursor: cursor || undefined },
+  });
+  return res.data;
+};
+
+// Full dump, streamed by the server; format is "csv" or "ndjson".
+export const exportActivityLogs = async (format = "csv") => {
+  const res = await api.get("/admin/allactivity", {
+    params: { format },
+    responseType: "blob",
+  });
   return res.data;
 };
 